@@ -0,0 +1,92 @@
+"""Compare EXR read/write throughput of exr_util with the previous implementation."""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Imath
+import numpy as np
+import OpenEXR
+
+from validation_tools.exr_util import read_exr, write_exr
+
+
+def read_exr_legacy(file_path):
+    """read_exr before the interleaved-buffer rework."""
+    exr_file = OpenEXR.InputFile(file_path)
+    header = exr_file.header()
+    dw = header["dataWindow"]
+    size = (dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1)
+
+    FLOAT = Imath.PixelType(Imath.PixelType.FLOAT)
+    rgb = [
+        np.frombuffer(exr_file.channel(c, FLOAT), dtype=np.float32)
+        for c in ("R", "G", "B")
+    ]
+    rgb = np.dstack(rgb)[0]
+    rgb = np.reshape(rgb, (size[1], size[0], 3))
+    return rgb
+
+
+def write_exr_legacy(file_path, data):
+    """write_exr before the interleaved-buffer rework."""
+    if data.dtype != np.float32:
+        data = data.astype(np.float32)
+
+    height, width, channels = data.shape
+    header = OpenEXR.Header(width, height)
+    half_chan = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
+    header["channels"] = {"R": half_chan, "G": half_chan, "B": half_chan}
+
+    exr = OpenEXR.OutputFile(file_path, header)
+    r = data[:, :, 0].tobytes()
+    g = data[:, :, 1].tobytes()
+    b = data[:, :, 2].tobytes()
+    exr.writePixels({"R": r, "G": g, "B": b})
+    exr.close()
+
+
+def throughput(fn, megabytes, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return megabytes * repeat / (time.perf_counter() - start)
+
+
+def main(resolution=1024, repeat=5):
+    y, x = np.mgrid[0:resolution, 0:resolution] / resolution
+    rng = np.random.default_rng(0)
+    img = np.dstack([x, y, 1 - x * y]) + rng.normal(0, 0.01, (*x.shape, 3))
+    img = img.astype(np.float32)
+    megabytes = img.nbytes / 1e6
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = f"{directory}/bench.exr"
+        half_path = f"{directory}/half.exr"
+        roi = (0, 0, resolution, resolution // 8)
+
+        cases = [
+            ("legacy write", lambda: write_exr_legacy(path, img)),
+            ("legacy read", lambda: read_exr_legacy(path)),
+            ("write", lambda: write_exr(path, img)),
+            ("read", lambda: read_exr(path)),
+            ("read roi 1/8", lambda: read_exr(path, roi=roi)),
+            ("write half", lambda: write_exr(half_path, img, half=True)),
+            ("read half", lambda: read_exr(half_path, dtype=np.float16)),
+        ]
+        for compression in ("none", "piz", "dwaa"):
+            path_c = f"{directory}/bench_{compression}.exr"
+            write = lambda p=path_c, c=compression: write_exr(p, img, compression=c)
+            cases.append((f"write {compression}", write))
+            cases.append((f"read {compression}", lambda p=path_c: read_exr(p)))
+
+        for name, fn in cases:
+            fn()  # Warm up, and create the file for the following read
+            print(f"{name:>16}: {throughput(fn, megabytes, repeat):8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
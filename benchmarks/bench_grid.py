@@ -0,0 +1,71 @@
+"""Time make_grid with serial and thread-pooled cell decoding."""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from validation_tools.exr_util import write_exr
+from validation_tools.scenegen import make_mat_prev_scene
+from validation_tools.validation import ValidationSuite
+
+
+def make_suite(cells, render_resolution, **kwargs):
+    """
+    Create a suite with `cells` scenes and synthetic Nori/Mitsuba renders.
+
+    `kwargs` are passed to `ValidationSuite`.
+    """
+    val = ValidationSuite(f"bench_grid_{cells}", **kwargs)
+    scene = make_mat_prev_scene()
+    scene.set_resolution(render_resolution, render_resolution)
+
+    # Smooth images with a little noise, so they compress like real renders
+    y, x = np.mgrid[0:render_resolution, 0:render_resolution] / render_resolution
+    base = np.dstack([x, y, 1 - x * y]).astype(np.float32)
+
+    rng = np.random.default_rng(0)
+    for i in range(cells):
+        val.register_scene(scene)
+        name = val.scenes[-1].name
+        for renderer in ("nori", "mitsuba"):
+            img = base * rng.uniform(0.5, 1.0) + rng.normal(0, 0.01, base.shape)
+            img = img.astype(np.float32)
+            path = f"{val.render_directory}/{name}_{renderer}"
+            write_exr(f"{path}.exr", img)
+            Image.fromarray((np.clip(img, 0, 1) * 255).astype(np.uint8)).save(
+                f"{path}.png"
+            )
+    return val
+
+
+def time_grid(val, cols, **kwargs):
+    start = time.perf_counter()
+    val.make_grid(cols=cols, cell_resolution=128, **kwargs)
+    return time.perf_counter() - start
+
+
+def main(render_resolution=256, workers=os.cpu_count()):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for cells, cols in ((25, 5), (400, 20)):
+                val = make_suite(cells, render_resolution)
+                serial = time_grid(val, cols)
+                threaded = time_grid(val, cols, workers=workers)
+                print(
+                    f"{cells} cells: serial {serial:.2f} s, "
+                    f"{workers} workers {threaded:.2f} s ({serial / threaded:.1f}x)"
+                )
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main(workers=int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count())
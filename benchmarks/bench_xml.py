@@ -0,0 +1,37 @@
+"""Compare the one-pass XML serializer with the previous minidom round trip."""
+
+import xml.etree.ElementTree as ET
+import xml.dom.minidom as minidom
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation_tools.scenegen import make_cbox_scene, make_mat_prev_scene, to_xml
+
+
+def generate_minidom(scene):
+    """The serializer used by Scene.generate before the one-pass writer."""
+    xml = to_xml(scene.desc)
+    return minidom.parseString(ET.tostring(xml)).toprettyxml(indent="\t")
+
+
+def generate_streaming(scene):
+    return scene.generate()
+
+
+def main(number=2000):
+    for scene in (make_cbox_scene(), make_mat_prev_scene()):
+        assert generate_minidom(scene) == generate_streaming(scene)
+
+        old = timeit.timeit(lambda: generate_minidom(scene), number=number)
+        new = timeit.timeit(lambda: generate_streaming(scene), number=number)
+        print(
+            f"{scene.name}: minidom {old / number * 1e6:.1f} us, "
+            f"streaming {new / number * 1e6:.1f} us ({old / new:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
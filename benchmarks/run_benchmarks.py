@@ -0,0 +1,375 @@
+"""Benchmark the hot paths of validation_tools and flag regressions.
+
+Every benchmark is timed with timeit (best of several repeats) and the
+results are appended to benchmarks/results/history.jsonl. Each result is
+compared to the median of the previous runs on the same machine, and
+benchmarks that got slower than the threshold are flagged.
+
+Runs offline: Nori is replaced by benchmarks/stub_nori.py and all inputs
+are generated in a temporary directory.
+
+Usage:
+    python benchmarks/run_benchmarks.py [-k FILTER] [--fail-on-regression]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import mitsuba as mi
+import numpy as np
+
+from validation_tools.color_util import color_range, color_range_array
+from validation_tools.exr_util import read_exr, write_exr
+from validation_tools.mesh_cache import MeshCache
+from validation_tools.nori_to_mitsuba import convert_scene
+from validation_tools.scenegen import make_cbox_scene, make_mat_prev_scene
+from validation_tools.validation import ValidationSuite
+from bench_grid import make_suite
+
+HISTORY_PATH = f"{BENCHMARK_DIR}/results/history.jsonl"
+STUB_NORI = f"{BENCHMARK_DIR}/stub_nori.py"
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark. The function sets it up and returns what to time."""
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the progress output of the suite while timing."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+        io.StringIO()
+    ):
+        yield
+
+
+@benchmark("make_cbox_scene")
+def bench_make_cbox_scene():
+    return make_cbox_scene
+
+
+@benchmark("make_mat_prev_scene")
+def bench_make_mat_prev_scene():
+    return make_mat_prev_scene
+
+
+@benchmark("scene_generate_cbox")
+def bench_scene_generate():
+    return make_cbox_scene().generate
+
+
+@benchmark("convert_scene_cbox")
+def bench_convert_scene():
+    make_cbox_scene().write("convert_nori.xml")
+    return lambda: convert_scene(
+        "convert_nori.xml", "convert_mitsuba.xml", verbose=False
+    )
+
+
+@benchmark("write_exr_1024")
+def bench_write_exr():
+    img = np.random.default_rng(0).random((1024, 1024, 3), dtype=np.float32)
+    return lambda: write_exr("bench.exr", img)
+
+
+@benchmark("read_exr_1024")
+def bench_read_exr():
+    img = np.random.default_rng(0).random((1024, 1024, 3), dtype=np.float32)
+    write_exr("bench_read.exr", img)
+    return lambda: read_exr("bench_read.exr")
+
+
+@benchmark("color_range_oklab_1000")
+def bench_color_range():
+    return lambda: list(color_range((0.01, 0.1, 0.3), (0.5, 0, 0.05), 1000, True))
+
+
+@benchmark("color_range_array_oklab_1e6")
+def bench_color_range_array():
+    return lambda: color_range_array((0.01, 0.1, 0.3), (0.5, 0, 0.05), 10**6, True)
+
+
+@benchmark("mitsuba_load_suzanne_obj")
+def bench_load_obj():
+    mi.set_variant("scalar_rgb")
+    obj_path = f"{REPO_DIR}/validation_tools/meshes/suzanne.obj"
+    return lambda: mi.load_dict({"type": "obj", "filename": obj_path})
+
+
+@benchmark("mitsuba_load_suzanne_ply")
+def bench_load_ply():
+    mi.set_variant("scalar_rgb")
+    obj_path = f"{REPO_DIR}/validation_tools/meshes/suzanne.obj"
+    ply_path = MeshCache("mesh_cache").ply_path(obj_path)
+    return lambda: mi.load_dict({"type": "ply", "filename": ply_path})
+
+
+def register_grid_benchmark(cells, cols, cell_resolution, thumbnails=False):
+    """
+    Time re-laying-out the grid of a suite.
+
+    With `thumbnails`, the suite caches thumbnail pyramids of its renders,
+    which repeated runs reuse. Otherwise every run decodes every render.
+    """
+    suffix = "_thumbnails" if thumbnails else ""
+
+    @benchmark(f"make_grid_{cells}_cells_{cell_resolution}px{suffix}")
+    def bench_make_grid():
+        with quiet():
+            val = make_suite(cells, render_resolution=256, cache_thumbnails=thumbnails)
+
+        def run():
+            with quiet():
+                val.make_grid(cols=cols, cell_resolution=cell_resolution)
+
+        return run
+
+
+for cells, cols in ((4, 2), (16, 4), (64, 8)):
+    for cell_resolution in (64, 256):
+        register_grid_benchmark(cells, cols, cell_resolution)
+register_grid_benchmark(64, 8, 64, thumbnails=True)
+register_grid_benchmark(400, 20, 64)
+register_grid_benchmark(400, 20, 64, thumbnails=True)
+
+
+@benchmark("validation_suite_4_scenes")
+def bench_validation_suite():
+    os.chmod(STUB_NORI, 0o755)
+    scenes = [make_cbox_scene(), make_mat_prev_scene()] * 2
+    for scene in scenes:
+        scene.set_resolution(64, 64)
+        scene.set_spp(4)
+    runs = iter(range(10**6))
+
+    def run():
+        with quiet():
+            val = ValidationSuite(
+                f"bench_suite_{next(runs)}", nori_executable=STUB_NORI
+            )
+            for scene in scenes:
+                val.register_scene(scene)
+            val.render()
+            val.make_grid(cols=2)
+
+    return run
+
+
+@benchmark("validation_suite_4_scenes_pipelined")
+def bench_validation_suite_pipelined():
+    os.chmod(STUB_NORI, 0o755)
+    scenes = [make_cbox_scene(), make_mat_prev_scene()] * 2
+    for scene in scenes:
+        scene.set_resolution(64, 64)
+        scene.set_spp(4)
+    runs = iter(range(10**6))
+
+    def run():
+        with quiet():
+            val = ValidationSuite(
+                f"bench_pipelined_{next(runs)}", nori_executable=STUB_NORI
+            )
+            for scene in scenes:
+                val.register_scene(scene)
+            val.render_pipelined(cols=2, compare=False)
+
+    return run
+
+
+# Modules that a suite only needs once it renders, grids or compares images
+HEAVY_MODULES = ["mitsuba", "drjit", "numpy", "cv2", "PIL", "OpenEXR", "tqdm"]
+
+STARTUP_IMPORT = "import validation_tools.validation"
+
+STARTUP_REGISTER = """
+import sys
+from validation_tools.validation import ValidationSuite
+from validation_tools.scenegen import make_mat_prev_scene
+val = ValidationSuite(sys.argv[1])
+val.register_scene(make_mat_prev_scene())
+"""
+
+STARTUP_CHECK = f"""
+import sys
+loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+if loaded:
+    sys.exit(f"imported at startup: {{', '.join(loaded)}}")
+"""
+
+
+def run_startup(code, *args):
+    """
+    Run `code` in a fresh interpreter, as a script or CI job would start.
+
+    Fails if the code imported any of the heavy modules.
+    """
+    subprocess.run(
+        [sys.executable, "-c", code + STARTUP_CHECK, *args],
+        env={**os.environ, "PYTHONPATH": REPO_DIR},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+
+@benchmark("startup_import_validation")
+def bench_startup_import():
+    run_startup(STARTUP_IMPORT)
+    return lambda: run_startup(STARTUP_IMPORT)
+
+
+@benchmark("startup_first_register_scene")
+def bench_startup_register():
+    runs = iter(range(10**6))
+    return lambda: run_startup(STARTUP_REGISTER, f"bench_startup_{next(runs)}")
+
+
+def time_benchmark(setup, repeat):
+    fn = setup()
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"best": min(times), "median": statistics.median(times), "number": number}
+
+
+def load_history():
+    if not os.path.exists(HISTORY_PATH):
+        return []
+    with open(HISTORY_PATH) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(history, name, window):
+    """Median of the best times of `name` in the last `window` runs on this machine."""
+    previous = [
+        run["results"][name]["best"]
+        for run in history
+        if run["machine"] == platform.node() and name in run["results"]
+    ]
+    if not previous:
+        return None
+    return statistics.median(previous[-window:])
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_time(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-k", "--filter", default="", help="only run benchmarks containing this string"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timing repeats per benchmark"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="slowdown flagged as a regression"
+    )
+    parser.add_argument(
+        "--window", type=int, default=5, help="previous runs in the baseline"
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="do not add the results to the history"
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="exit with status 1 on regressions",
+    )
+    args = parser.parse_args()
+
+    history = load_history()
+    names = [name for name in BENCHMARKS if args.filter in name]
+    width = max(len(name) for name in names)
+
+    results = {}
+    regressions = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        # Same layout as a Nori checkout, so scenes find the meshes
+        os.makedirs("validation")
+        os.symlink(f"{REPO_DIR}/validation_tools", "validation/validation_tools")
+        try:
+            for name in names:
+                try:
+                    result = time_benchmark(BENCHMARKS[name], args.repeat)
+                except subprocess.CalledProcessError as e:
+                    regressions.append(name)
+                    print(f"{name:<{width}}  FAILED: {e.stderr.strip()}", flush=True)
+                    continue
+                results[name] = result
+
+                reference = baseline(history, name, args.window)
+                line = f"{name:<{width}}  {format_time(result['best']):>10}"
+                if reference is not None:
+                    ratio = result["best"] / reference
+                    line += f"  {ratio:5.2f}x of {format_time(reference)}"
+                    if ratio > 1 + args.threshold:
+                        regressions.append(name)
+                        line += "  REGRESSION"
+                print(line, flush=True)
+        finally:
+            os.chdir(cwd)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+        with open(HISTORY_PATH, "a") as f:
+            record = {
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "machine": platform.node(),
+                "python": platform.python_version(),
+                "results": results,
+            }
+            f.write(json.dumps(record) + "\n")
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Stand-in for ./build/nori that writes a synthetic render of a scene.
+
+Usage: stub_nori.py -b scene.xml
+
+Like Nori, writes scene.png and scene.exr next to the scene file, at the
+resolution of the scene's camera. No actual rendering happens, so suites run
+offline and without a Nori build, and benchmarks measure the suite itself.
+"""
+
+import xml.etree.ElementTree as ET
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from validation_tools.exr_util import write_exr
+
+
+def main(argv):
+    scene_file = argv[-1]
+    camera = ET.parse(scene_file).getroot().find("camera")
+    size = {
+        tag.get("name"): int(tag.get("value"))
+        for tag in camera.iter("integer")
+        if tag.get("name") in ("width", "height")
+    }
+    width, height = size["width"], size["height"]
+
+    y, x = np.mgrid[0:height, 0:width]
+    img = np.dstack([x / width, y / height, 1 - x * y / (width * height)])
+    img = img.astype(np.float32)
+
+    base = os.path.splitext(scene_file)[0]
+    write_exr(f"{base}.exr", img)
+    Image.fromarray((img * 255).astype(np.uint8)).save(f"{base}.png")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,3 +1,70 @@
+import numpy as np
+
+# Oklab conversion matrices, see https://bottosson.github.io/posts/oklab/
+RGB_TO_LMS = np.array(
+    [
+        [0.4122214708, 0.5363325363, 0.0514459929],
+        [0.2119034982, 0.6806995451, 0.1073969566],
+        [0.0883024619, 0.2817188376, 0.6299787005],
+    ]
+)
+LMS_TO_OKLAB = np.array(
+    [
+        [0.2104542553, 0.7936177850, -0.0040720468],
+        [1.9779984951, -2.4285922050, 0.4505937099],
+        [0.0259040371, 0.7827717662, -0.8086757660],
+    ]
+)
+OKLAB_TO_LMS = np.array(
+    [
+        [1.0, 0.3963377774, 0.2158037573],
+        [1.0, -0.1055613458, -0.0638541728],
+        [1.0, -0.0894841775, -1.2914855480],
+    ]
+)
+LMS_TO_RGB = np.array(
+    [
+        [4.0767416621, -3.3077115913, 0.2309699292],
+        [-1.2684380046, 2.6097574011, -0.3413193965],
+        [-0.0041960863, -0.7034186147, 1.7076147010],
+    ]
+)
+
+
+def _as_float_array(colors):
+    colors = np.asarray(colors)
+    if not np.issubdtype(colors.dtype, np.floating):
+        colors = colors.astype(np.float64)
+    return colors
+
+
+def _apply_matrix(colors, matrix):
+    """Multiply every color in the last axis of `colors` by `matrix`."""
+    return colors @ matrix.T.astype(colors.dtype)
+
+
+def color_range_array(start, end, n, use_oklab=False, clip="clamp"):
+    """
+    Return n colors linearly interpolated between start and end as an (n, C) array.
+
+    Args:
+        start (tuple): RGB (or RGBA) start color.
+        end (tuple): RGB (or RGBA) end color.
+        n (int): Number of colors to generate.
+        use_oklab (bool): Whether to interpolate in Oklab color space (RGB only).
+        clip (str): Gamut clipping method when using Oklab, see `oklab_to_rgb_array`.
+    """
+    start = _as_float_array(start)
+    end = _as_float_array(end)
+    t = (np.arange(n) / (n - 1) if n > 1 else np.zeros(n))[:, None]
+
+    if use_oklab:
+        start = rgb_to_oklab_array(start)
+        end = rgb_to_oklab_array(end)
+        return oklab_to_rgb_array(start * (1 - t) + end * t, clip=clip)
+    return start * (1 - t) + end * t
+
+
 def color_range(start, end, n, use_oklab=False):
     """
     Generate n colors linearly interpolated between start and end.
@@ -11,57 +78,87 @@ def color_range(start, end, n, use_oklab=False):
     Yields:
         tuple: Interpolated color.
     """
-    if use_oklab:
-        start = rgb_to_oklab(start)
-        end = rgb_to_oklab(end)
-        for i in range(n):
-            t = i / (n - 1) if n > 1 else 0
-            yield oklab_to_rgb(
-                tuple(start[j] * (1 - t) + end[j] * t for j in range(len(start)))
-            )
-    else:
-        for i in range(n):
-            t = i / (n - 1) if n > 1 else 0
-            yield tuple(start[j] * (1 - t) + end[j] * t for j in range(len(start)))
+    for color in color_range_array(start, end, n, use_oklab):
+        yield tuple(float(c) for c in color)
 
 
-def rgb_to_oklab(rgb):
-    r, g, b = rgb
+def rgb_to_oklab_array(rgb):
+    """Convert linear RGB colors of shape (..., 3), e.g. (N, 3) or (H, W, 3), to Oklab."""
+    rgb = _as_float_array(rgb)
+    lms = _apply_matrix(rgb, RGB_TO_LMS)
+    return _apply_matrix(np.cbrt(lms), LMS_TO_OKLAB)
 
-    l = 0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b
-    m = 0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b
-    s = 0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b
 
-    l_ = l ** (1 / 3)
-    m_ = m ** (1 / 3)
-    s_ = s ** (1 / 3)
+def _oklab_to_linear_rgb(lab):
+    lms = _apply_matrix(lab, OKLAB_TO_LMS) ** 3
+    return _apply_matrix(lms, LMS_TO_RGB)
 
-    L = 0.2104542553 * l_ + 0.7936177850 * m_ - 0.0040720468 * s_
-    a = 1.9779984951 * l_ - 2.4285922050 * m_ + 0.4505937099 * s_
-    b = 0.0259040371 * l_ + 0.7827717662 * m_ - 0.8086757660 * s_
-    return (L, a, b)
 
+def in_gamut(rgb, eps=1e-6):
+    """Return a boolean mask of the RGB colors that lie within [0, 1]."""
+    return np.all((rgb >= -eps) & (rgb <= 1 + eps), axis=-1)
 
-def oklab_to_rgb(Lab):
-    L, a, b = Lab
 
-    l_ = L + 0.3963377774 * a + 0.2158037573 * b
-    m_ = L - 0.1055613458 * a - 0.0638541728 * b
-    s_ = L - 0.0894841775 * a - 1.2914855480 * b
+def gamut_clip_chroma(lab, iterations=24):
+    """
+    Map Oklab colors into the RGB gamut while preserving lightness and hue.
 
-    l = l_**3
-    m = m_**3
-    s = s_**3
+    Lightness is clamped to [0, 1], then the chroma of every out-of-gamut
+    color is reduced by bisection until it fits into the gamut. All colors
+    are processed together, there is no per-color Python loop.
+    """
+    lab = np.array(lab, dtype=np.result_type(lab, np.float32))
+    lab[..., 0] = np.clip(lab[..., 0], 0, 1)
+
+    outside = ~in_gamut(_oklab_to_linear_rgb(lab))
+    if not np.any(outside):
+        return lab
+
+    candidates = lab[outside]
+    low = np.zeros(len(candidates), dtype=lab.dtype)
+    high = np.ones(len(candidates), dtype=lab.dtype)
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        scaled = candidates.copy()
+        scaled[:, 1:] *= mid[:, None]
+        fits = in_gamut(_oklab_to_linear_rgb(scaled))
+        low = np.where(fits, mid, low)
+        high = np.where(fits, high, mid)
+
+    candidates[:, 1:] *= low[:, None]
+    lab[outside] = candidates
+    return lab
+
+
+def oklab_to_rgb_array(lab, clip="clamp"):
+    """
+    Convert Oklab colors of shape (..., 3) to linear RGB.
 
-    r = +4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s
-    g = -1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s
-    b = -0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s
+    Args:
+        lab (array): Oklab colors.
+        clip (str): How to handle colors outside of the RGB gamut:
+            "clamp" clamps each channel to [0, 1],
+            "chroma" reduces chroma at constant lightness and hue (see
+            `gamut_clip_chroma`), None leaves the colors unclipped.
+    """
+    lab = _as_float_array(lab)
+    if clip == "chroma":
+        lab = gamut_clip_chroma(lab)
+    elif clip not in ("clamp", None):
+        raise ValueError(f"Gamut clipping method {clip} not recognized.")
 
-    r = max(0, min(1, r))
-    g = max(0, min(1, g))
-    b = max(0, min(1, b))
+    rgb = _oklab_to_linear_rgb(lab)
+    if clip is not None:
+        rgb = np.clip(rgb, 0, 1)
+    return rgb
 
-    return (r, g, b)
+
+def rgb_to_oklab(rgb):
+    return tuple(float(c) for c in rgb_to_oklab_array(rgb))
+
+
+def oklab_to_rgb(Lab):
+    return tuple(float(c) for c in oklab_to_rgb_array(Lab))
 
 
 def color_to_str(color):
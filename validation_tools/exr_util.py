@@ -2,38 +2,202 @@ import numpy as np
 import OpenEXR
 import Imath
 
-def read_exr(file_path):
+COMPRESSION = {
+    "none": OpenEXR.NO_COMPRESSION,
+    "rle": OpenEXR.RLE_COMPRESSION,
+    "zips": OpenEXR.ZIPS_COMPRESSION,
+    "zip": OpenEXR.ZIP_COMPRESSION,
+    "piz": OpenEXR.PIZ_COMPRESSION,
+    "pxr24": OpenEXR.PXR24_COMPRESSION,
+    "b44": OpenEXR.B44_COMPRESSION,
+    "b44a": OpenEXR.B44A_COMPRESSION,
+    "dwaa": OpenEXR.DWAA_COMPRESSION,
+    "dwab": OpenEXR.DWAB_COMPRESSION,
+}
+
+RGB = ("R", "G", "B")
+RGBA = ("R", "G", "B", "A")
+
+
+def _compression(name):
+    """Look up a compression by its key in `COMPRESSION`."""
+    try:
+        return COMPRESSION[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown EXR compression {name!r}, expected one of "
+            f"{', '.join(COMPRESSION)}."
+        ) from None
+
+
+def _default_channels(count):
+    if count == 3:
+        return RGB
+    if count == 4:
+        return RGBA
+    raise ValueError(f"Channel names are required for {count} channels.")
+
+
+def exr_channels(file_path):
+    """Return the names of all channels (RGB, alpha and AOVs) of an EXR file."""
+    with OpenEXR.File(file_path, separate_channels=True, header_only=True) as exr:
+        return [channel.name for channel in exr.header()["channels"]]
+
+
+def exr_size(file_path):
+    """Return the (width, height) of the data window of an EXR file."""
+    with OpenEXR.File(file_path, header_only=True) as exr:
+        (min_x, min_y), (max_x, max_y) = exr.header()["dataWindow"]
+        return int(max_x - min_x + 1), int(max_y - min_y + 1)
+
+
+def read_exr(file_path, channels=RGB, roi=None, dtype=np.float32):
+    """
+    Read channels of an EXR file into a single interleaved array.
+
+    Args:
+        file_path (str): Path of the EXR file.
+        channels (tuple): Names of the channels to read, e.g. ("R", "G", "B", "A")
+            or AOV channels like ("albedo.R", "albedo.G", "albedo.B").
+        roi (tuple): Optional region of interest (x, y, width, height) relative
+            to the data window. Only the scanlines of the region are decoded.
+        dtype: np.float32, or np.float16 for half-float data.
+
+    Returns:
+        np.ndarray: Array of shape (height, width, len(channels)).
+    """
+    channels = tuple(channels)
+    if roi is not None:
+        return _read_exr_roi(file_path, channels, roi, dtype)
+
+    merged = {RGB: "RGB", RGBA: "RGBA"}.get(channels)
+    with OpenEXR.File(file_path, separate_channels=merged is None) as exr:
+        pixels = exr.channels()
+        if merged is not None and merged in pixels:
+            # Already interleaved, no copy unless the pixel type differs
+            return pixels[merged].pixels.astype(dtype, copy=False)
+        if merged is None:
+            return _interleave(file_path, pixels, channels, dtype)
+
+    # RGB requested from an RGBA file (or vice versa), select channels by name
+    with OpenEXR.File(file_path, separate_channels=True) as exr:
+        return _interleave(file_path, exr.channels(), channels, dtype)
+
+
+def _interleave(file_path, pixels, channels, dtype):
+    missing = [c for c in channels if c not in pixels]
+    if missing:
+        raise KeyError(f"Channels {missing} not found in {file_path}.")
+
+    height, width = pixels[channels[0]].pixels.shape
+    data = np.empty((height, width, len(channels)), dtype=dtype)
+    for i, c in enumerate(channels):
+        data[:, :, i] = pixels[c].pixels
+    return data
+
+
+def _read_exr_roi(file_path, channels, roi, dtype):
+    x, y, width, height = roi
     exr_file = OpenEXR.InputFile(file_path)
-    header = exr_file.header()
-    dw = header["dataWindow"]
-    size = (dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1)
-
-    FLOAT = Imath.PixelType(Imath.PixelType.FLOAT)
-    rgb = [
-        np.frombuffer(exr_file.channel(c, FLOAT), dtype=np.float32)
-        for c in ("R", "G", "B")
-    ]
-    rgb = np.dstack(rgb)[0]
-    rgb = np.reshape(rgb, (size[1], size[0], 3))
-    return rgb
-
-
-def write_exr(file_path, data):
-    if data.dtype != np.float32:
-        data = data.astype(np.float32)
-
-    height, width, channels = data.shape
-    assert channels == 3, "Data must have 3 channels (RGB)."
-
-    header = OpenEXR.Header(width, height)
-    half_chan = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
-    header["channels"] = {"R": half_chan, "G": half_chan, "B": half_chan}
-
-    exr = OpenEXR.OutputFile(file_path, header)
-
-    # Split into channels and write
-    r = data[:, :, 0].tobytes()
-    g = data[:, :, 1].tobytes()
-    b = data[:, :, 2].tobytes()
-    exr.writePixels({"R": r, "G": g, "B": b})
-    exr.close()
+    try:
+        dw = exr_file.header()["dataWindow"]
+        full_width = dw.max.x - dw.min.x + 1
+        full_height = dw.max.y - dw.min.y + 1
+        if x < 0 or y < 0 or x + width > full_width or y + height > full_height:
+            raise ValueError(f"Region {roi} exceeds the data window of {file_path}.")
+
+        half = np.dtype(dtype) == np.float16
+        pixel_type = Imath.PixelType(
+            Imath.PixelType.HALF if half else Imath.PixelType.FLOAT
+        )
+        buffer_dtype = np.float16 if half else np.float32
+
+        data = np.empty((height, width, len(channels)), dtype=dtype)
+        for i, c in enumerate(channels):
+            rows = exr_file.channel(
+                c, pixel_type, dw.min.y + y, dw.min.y + y + height - 1
+            )
+            rows = np.frombuffer(rows, dtype=buffer_dtype).reshape(height, full_width)
+            data[:, :, i] = rows[:, x : x + width]
+        return data
+    finally:
+        exr_file.close()
+
+
+def write_exr(file_path, data, channels=None, half=False, compression="zip"):
+    """
+    Write an interleaved array of shape (height, width, channels) to an EXR file.
+
+    Args:
+        file_path (str): Path of the EXR file.
+        data (np.ndarray): Pixel data.
+        channels (tuple): Channel names. Defaults to RGB for 3 channels and
+            RGBA for 4 channels. AOVs can be named like "albedo.R".
+        half (bool): Store half-float instead of float channels.
+        compression (str): One of the keys of `COMPRESSION`, e.g. "zip",
+            "piz" or "dwaa".
+    """
+    compression = _compression(compression)
+    height, width, count = data.shape
+    channels = tuple(channels) if channels is not None else _default_channels(count)
+    assert len(channels) == count, "Number of channel names must match the data."
+
+    dtype = np.float16 if half else np.float32
+    # The bindings read the raw buffer, so it must be C-contiguous
+    data = np.ascontiguousarray(data, dtype=dtype)
+
+    merged = {RGB: "RGB", RGBA: "RGBA"}.get(channels)
+    if merged is not None:
+        pixels = {merged: data}
+    else:
+        pixels = {c: np.ascontiguousarray(data[:, :, i]) for i, c in enumerate(channels)}
+
+    header = {"compression": compression, "type": OpenEXR.scanlineimage}
+    with OpenEXR.File(header, pixels) as exr:
+        exr.write(file_path)
+
+
+class ExrWriter:
+    """Write an RGB EXR file in bands of scanlines, from top to bottom.
+
+    Takes the same `compression` names as `write_exr`.
+    """
+
+    def __init__(self, file_path, width, height, half=False, compression="zip"):
+        compression = _compression(compression)
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.dtype = np.float16 if half else np.float32
+
+        header = OpenEXR.Header(width, height)
+        pixel_type = Imath.PixelType(
+            Imath.PixelType.HALF if half else Imath.PixelType.FLOAT
+        )
+        chan = Imath.Channel(pixel_type)
+        header["channels"] = {"R": chan, "G": chan, "B": chan}
+        header["compression"] = Imath.Compression(int(compression))
+        self.exr = OpenEXR.OutputFile(file_path, header)
+
+    def write_rows(self, data):
+        """Append a band of shape (rows, width, 3) below the rows written so far."""
+        rows, width, channels = data.shape
+        assert width == self.width, "Band must span the full image width."
+        assert channels == 3, "Data must have 3 channels (RGB)."
+        assert self.rows_written + rows <= self.height, "Too many rows."
+
+        # One planar copy of the band, then each channel is a contiguous slice
+        planar = np.ascontiguousarray(data.transpose(2, 0, 1), dtype=self.dtype)
+        self.exr.writePixels(
+            {c: planar[i].data for i, c in enumerate(RGB)}, rows
+        )
+        self.rows_written += rows
+
+    def close(self):
+        self.exr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
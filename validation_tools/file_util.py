@@ -0,0 +1,29 @@
+import contextlib
+import os
+import threading
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """Yield a temporary path that replaces `path` once the block succeeds.
+
+    The temporary path is private to the calling process and thread, so
+    concurrent writers of the same file never mix their contents and readers
+    never see a partially written file. It is removed if the block raises.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    """Like `open(path, mode)`, but the file only appears once it is complete."""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode) as f:
+            yield f
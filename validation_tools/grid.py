@@ -0,0 +1,175 @@
+from validation_tools.exr_util import ExrWriter, read_exr, write_exr
+from validation_tools.thumbnails import srgb_cell
+from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+import cv2
+
+# zlib level of grid PNGs. Large grids of noisy renders take several times
+# longer to encode at the default level 6 for about 15% smaller files.
+PNG_COMPRESS_LEVEL = 1
+
+
+def grid_size(count, rows=None, cols=None):
+    """Return the (cols, rows) of a grid with `count` cells."""
+    if rows is None and cols is None:
+        cols = count
+        rows = 1
+    elif rows is None:
+        rows = (count + cols - 1) // cols
+    elif cols is None:
+        cols = (count + rows - 1) // rows
+    return cols, rows
+
+
+def load_png_cell(path, resolution):
+    img = Image.open(path)
+    return img.resize((resolution, resolution))
+
+
+def load_exr_cell(path, resolution):
+    img = read_exr(path)
+    return cv2.resize(img, (resolution, resolution), interpolation=cv2.INTER_CUBIC)
+
+
+class GridCanvas:
+    """PNG and EXR image grids of Nori (and Mitsuba) renders, filled in one cell at a time."""
+
+    def __init__(self, size, resolution, nori_only=False, exr=True, thumbnails=None):
+        self.size = size
+        self.resolution = resolution
+        self.thumbnails = thumbnails
+        self.renderers = ["nori"] if nori_only else ["nori", "mitsuba"]
+
+        width, height = size[0] * resolution, size[1] * resolution
+        self.png = {r: Image.new("RGB", (width, height)) for r in self.renderers}
+        self.exr = None
+        if exr:
+            self.exr = {
+                r: np.zeros((height, width, 3), dtype=np.float32)
+                for r in self.renderers
+            }
+
+    def load(self, render_directory, scene_name):
+        """
+        Decode and resize the renders of a scene, once per format.
+
+        Does not modify the canvas, so cells can be loaded from several
+        threads at once. Returns the cells to pass to `paste`. With a
+        `ThumbnailCache`, both cells are resized from its pyramid of the EXR
+        render and the PNG cell is its sRGB encoding.
+        """
+        cells = {}
+        for renderer in self.renderers:
+            path = f"{render_directory}/{scene_name}_{renderer}"
+            if self.thumbnails is not None:
+                exr = self.thumbnails.cell(f"{path}.exr", self.resolution)
+                png = srgb_cell(exr)
+                cells[renderer] = (png, exr if self.exr is not None else None)
+                continue
+            png = load_png_cell(f"{path}.png", self.resolution)
+            exr = None
+            if self.exr is not None:
+                exr = load_exr_cell(f"{path}.exr", self.resolution)
+            cells[renderer] = (png, exr)
+        return cells
+
+    def paste(self, index, cells):
+        """Place cells returned by `load` in cell `index`."""
+        resolution = self.resolution
+        x = index % self.size[0] * resolution
+        y = index // self.size[0] * resolution
+
+        for renderer, (png, exr) in cells.items():
+            self.png[renderer].paste(png, (x, y))
+            if exr is not None:
+                self.exr[renderer][y : y + resolution, x : x + resolution] = exr
+
+    def place(self, index, render_directory, scene_name):
+        """Load the renders of a scene and place them in cell `index`."""
+        self.paste(index, self.load(render_directory, scene_name))
+
+    def fill(self, render_directory, scene_names, executor=None):
+        """Place the renders of all scenes, loading cells on `executor` if given."""
+        map_ = map if executor is None else executor.map
+        cells = map_(lambda name: self.load(render_directory, name), scene_names)
+        for index, scene_cells in enumerate(cells):
+            self.paste(index, scene_cells)
+
+    def save(self, render_directory, name):
+        for renderer in self.renderers:
+            self.png[renderer].save(
+                f"{render_directory}/{name}_{renderer}.png",
+                compress_level=PNG_COMPRESS_LEVEL,
+            )
+            if self.exr is not None:
+                write_exr(
+                    f"{render_directory}/{name}_{renderer}.exr", self.exr[renderer]
+                )
+
+    def save_labeled(self, render_directory, name, labels):
+        resolution = 256
+        nori_grid = self.png["nori"].resize((resolution, resolution))
+        draw = ImageDraw.Draw(nori_grid)
+        font = ImageFont.load_default(size=24)
+        for i, label in enumerate(labels):
+            bbox = draw.textbbox((0, 0), label, font=font)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+            position = (
+                (i % self.size[0] + 0.5) * resolution - text_width // 2,
+                (i // self.size[0] + 0.5) * resolution - text_height // 2,
+            )
+            draw.text(
+                position,
+                label,
+                fill="white",
+                align="center",
+                font=font,
+                stroke_fill="black",
+                stroke_width=3,
+            )
+        nori_grid.save(f"{render_directory}/{name}_nori_labeled.png")
+
+
+def write_exr_grids_in_bands(
+    render_directory,
+    name,
+    scene_names,
+    size,
+    resolution,
+    renderers,
+    executor=None,
+    thumbnails=None,
+):
+    """
+    Write the EXR grids of all renderers one row of cells at a time.
+
+    Only one band of `resolution` rows per renderer is held in memory, no
+    matter how many cells the grid has. All renderers are written in the
+    same pass over the grid. The cells of a band are loaded on `executor`
+    if given, and from `thumbnails` (a `ThumbnailCache`) if given.
+    """
+    map_ = map if executor is None else executor.map
+    load_cell = load_exr_cell if thumbnails is None else thumbnails.cell
+    width = size[0] * resolution
+    height = size[1] * resolution
+    writers = {
+        r: ExrWriter(f"{render_directory}/{name}_{r}.exr", width, height)
+        for r in renderers
+    }
+    try:
+        for row in range(size[1]):
+            row_names = scene_names[row * size[0] : (row + 1) * size[0]]
+            for renderer in renderers:
+                band = np.zeros((resolution, width, 3), dtype=np.float32)
+                paths = [
+                    f"{render_directory}/{scene_name}_{renderer}.exr"
+                    for scene_name in row_names
+                ]
+                cells = map_(lambda path: load_cell(path, resolution), paths)
+                for col, cell in enumerate(cells):
+                    band[:, col * resolution : (col + 1) * resolution] = cell
+                writers[renderer].write_rows(band)
+    finally:
+        for writer in writers.values():
+            writer.close()
@@ -0,0 +1,57 @@
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    """Stands in for a module that is only imported on first attribute access.
+
+    `mi = LazyModule("mitsuba")` costs nothing at import time, `mi.load_file`
+    imports Mitsuba and then behaves exactly like the real module.
+    Attributes are looked up on the module on every access, so attributes
+    that change at runtime, like those set by `mi.set_variant`, stay current.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+        self.__lock = threading.Lock()
+
+    # Private, so it never hides an attribute of the module, like `np.load`
+    def __import(self):
+        """Import the module if needed and return it."""
+        if self.__module is None:
+            with self.__lock:
+                if self.__module is None:
+                    self.__module = importlib.import_module(self.__name)
+        return self.__module
+
+    def __getattr__(self, attr):
+        return getattr(self.__import(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__module is not None else "not loaded"
+        return f"<lazy module '{self.__name}' ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def module_version(name):
+    """
+    Version of a module, without importing it if it is not imported yet.
+
+    Falls back to the version of the installed distribution of the same name,
+    which is what cache keys need and is much cheaper than importing a large
+    module like Mitsuba.
+    """
+    module = sys.modules.get(name)
+    if module is not None and hasattr(module, "__version__"):
+        return module.__version__
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return importlib.import_module(name).__version__
@@ -0,0 +1,84 @@
+from validation_tools.lazy import lazy_import, module_version
+from validation_tools.file_util import atomic_path
+from validation_tools.render_cache import file_digest
+import hashlib
+import os
+import threading
+
+mi = lazy_import("mitsuba")
+
+DEFAULT_MESH_CACHE_DIR = "validation/cache/meshes"
+
+
+class MeshCache:
+    """OBJ meshes converted once to binary PLY files for Mitsuba.
+
+    Meshes are loaded with Mitsuba's own OBJ loader and written with
+    `Mesh.write_ply`, so the cached mesh is exactly what Mitsuba would have
+    built from the OBJ file. Entries are stored as `directory/<key>.ply`,
+    where the key covers the contents of the OBJ file, the loader options
+    and the Mitsuba version.
+    """
+
+    def __init__(self, directory=DEFAULT_MESH_CACHE_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def ply_path(self, obj_path, flip_tex_coords=True):
+        """Return the cached PLY file of an OBJ file, converting it if needed."""
+        sha = hashlib.sha256()
+        key = f"{file_digest(obj_path)} {flip_tex_coords} {module_version('mitsuba')}"
+        sha.update(key.encode())
+        path = f"{self.directory}/{sha.hexdigest()}.ply"
+
+        with self.lock:
+            if not os.path.exists(path):
+                self.__convert(obj_path, path, flip_tex_coords)
+        return path
+
+    def __convert(self, obj_path, ply_path, flip_tex_coords):
+        if mi.variant() is None:
+            mi.set_variant("scalar_rgb")
+        mesh = mi.load_dict(
+            {"type": "obj", "filename": obj_path, "flip_tex_coords": flip_tex_coords}
+        )
+        # Other processes may convert the same mesh, never expose a partial file
+        with atomic_path(ply_path) as tmp_path:
+            mesh.write_ply(tmp_path)
+
+    def rewrite_scene(self, root, scene_dir):
+        """
+        Point all OBJ shapes of a Mitsuba scene element at cached PLY files.
+
+        Relative file names are resolved against `scene_dir`, the directory
+        of the Mitsuba scene file, and the cached files are referenced
+        relative to it. Shapes whose OBJ file does not exist are left as
+        they are, so Mitsuba reports the missing file.
+        """
+        for shape in root.iter("shape"):
+            if shape.get("type") != "obj":
+                continue
+            filename = None
+            flip = None
+            for child in shape:
+                if child.tag == "string" and child.get("name") == "filename":
+                    filename = child
+                elif child.get("name") == "flip_tex_coords":
+                    flip = child
+
+            if filename is None:
+                continue
+            obj_path = os.path.join(scene_dir, filename.get("value"))
+            if not os.path.exists(obj_path):
+                continue
+
+            flip_tex_coords = flip is None or flip.get("value") == "true"
+            ply_path = self.ply_path(obj_path, flip_tex_coords)
+            shape.set("type", "ply")
+            filename.set(
+                "value", os.path.relpath(ply_path, scene_dir).replace(os.sep, "/")
+            )
+            # Only the OBJ loader knows this option, the PLY is already flipped
+            if flip is not None:
+                shape.remove(flip)
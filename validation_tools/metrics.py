@@ -0,0 +1,146 @@
+from validation_tools.color_util import rgb_to_oklab_array
+from validation_tools.exr_util import exr_size, read_exr
+import numpy as np
+import cv2
+
+METRICS = ["mse", "relmse", "smape", "ssim", "delta_e_ok"]
+
+# Stabilizes relative metrics in dark regions
+RELATIVE_EPS = 1e-2
+
+# SSIM parameters (Wang et al. 2004)
+SSIM_SIGMA = 1.5
+SSIM_RADIUS = 5
+SSIM_C1 = 0.01**2
+SSIM_C2 = 0.03**2
+
+
+def to_display(img):
+    """Clamp linear RGB to [0, 1] and apply the sRGB transfer function."""
+    img = np.clip(img, 0, 1)
+    return np.where(img <= 0.0031308, 12.92 * img, 1.055 * img ** (1 / 2.4) - 0.055)
+
+
+def luminance(img):
+    return img @ np.array([0.2126, 0.7152, 0.0722], dtype=img.dtype)
+
+
+def relative_error(test, reference):
+    """Per-pixel relative squared error, averaged over channels."""
+    return np.mean((test - reference) ** 2 / (reference**2 + RELATIVE_EPS), axis=-1)
+
+
+def ssim_map(a, b):
+    """SSIM of two single-channel images, with a Gaussian window."""
+    def blur(x):
+        return cv2.GaussianBlur(x, (2 * SSIM_RADIUS + 1,) * 2, SSIM_SIGMA)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a**2
+    var_b = blur(b * b) - mu_b**2
+    cov = blur(a * b) - mu_a * mu_b
+    return ((2 * mu_a * mu_b + SSIM_C1) * (2 * cov + SSIM_C2)) / (
+        (mu_a**2 + mu_b**2 + SSIM_C1) * (var_a + var_b + SSIM_C2)
+    )
+
+
+def compare_images(test, reference, chunk_rows=256, heatmap=False):
+    """
+    Compare a test image to a reference image of the same shape.
+
+    The images are processed in bands of `chunk_rows` rows, so temporaries
+    stay small even for large images. SSIM bands are computed with a halo
+    of rows around them and match the SSIM of the whole image.
+
+    Returns a dict with:
+        mse: Mean squared error.
+        relmse: Mean squared error relative to the squared reference.
+        smape: Symmetric mean absolute percentage error.
+        ssim: Mean SSIM of the display-referred luminance.
+        delta_e_ok: Mean perceptual color difference (Euclidean distance
+            in Oklab) of the display-referred images, times 100.
+        heatmap (optional): False-color BGR image of the per-pixel relative
+            error on a logarithmic scale from 1e-4 to 1.
+    """
+    if test.shape != reference.shape:
+        raise ValueError(
+            f"Image shapes {test.shape} and {reference.shape} do not match."
+        )
+
+    def read_rows(start, end):
+        return test[start:end], reference[start:end]
+
+    height, width = test.shape[:2]
+    return _compare_bands(read_rows, width, height, chunk_rows, heatmap)
+
+
+def compare_exr_files(test_path, reference_path, chunk_rows=256, heatmap=False):
+    """
+    Compare two EXR files like `compare_images`, reading them band by band.
+
+    Only the scanlines of the current band (plus the SSIM halo) are decoded,
+    so memory use does not depend on the image size.
+    """
+    size = exr_size(test_path)
+    if size != exr_size(reference_path):
+        raise ValueError(
+            f"Image sizes of {test_path} and {reference_path} do not match."
+        )
+
+    width, height = size
+
+    def read_rows(start, end):
+        roi = (0, start, width, end - start)
+        return read_exr(test_path, roi=roi), read_exr(reference_path, roi=roi)
+
+    return _compare_bands(read_rows, width, height, chunk_rows, heatmap)
+
+
+def _compare_bands(read_rows, width, height, chunk_rows, heatmap):
+    sums = dict.fromkeys(METRICS, 0.0)
+    error_map = np.zeros((height, width), dtype=np.uint8) if heatmap else None
+    channels = None
+
+    for start in range(0, height, chunk_rows):
+        end = min(start + chunk_rows, height)
+        halo_start = max(start - SSIM_RADIUS, 0)
+        halo_end = min(end + SSIM_RADIUS, height)
+
+        test_halo, reference_halo = read_rows(halo_start, halo_end)
+        test_halo = test_halo.astype(np.float32, copy=False)
+        reference_halo = reference_halo.astype(np.float32, copy=False)
+        t = test_halo[start - halo_start : end - halo_start]
+        r = reference_halo[start - halo_start : end - halo_start]
+        channels = t.shape[2]
+
+        sums["mse"] += float(np.sum((t - r) ** 2))
+        rel = relative_error(t, r)
+        sums["relmse"] += float(np.sum(rel))
+        sums["smape"] += float(
+            np.sum(np.abs(t - r) / (np.abs(t) + np.abs(r) + RELATIVE_EPS))
+        )
+
+        lab_t = rgb_to_oklab_array(to_display(t))
+        lab_r = rgb_to_oklab_array(to_display(r))
+        sums["delta_e_ok"] += float(np.sum(np.linalg.norm(lab_t - lab_r, axis=-1)))
+
+        band = ssim_map(
+            luminance(to_display(test_halo)), luminance(to_display(reference_halo))
+        )
+        sums["ssim"] += float(np.sum(band[start - halo_start : end - halo_start]))
+
+        if heatmap:
+            log_rel = np.log10(np.maximum(rel, 1e-4))
+            error_map[start:end] = np.clip((log_rel + 4) / 4 * 255, 0, 255)
+
+    pixels = height * width
+    result = {
+        "mse": sums["mse"] / (pixels * channels),
+        "relmse": sums["relmse"] / pixels,
+        "smape": sums["smape"] / (pixels * channels),
+        "ssim": sums["ssim"] / pixels,
+        "delta_e_ok": sums["delta_e_ok"] / pixels * 100,
+    }
+    if heatmap:
+        result["heatmap"] = cv2.applyColorMap(error_map, cv2.COLORMAP_INFERNO)
+    return result
@@ -0,0 +1,117 @@
+import xml.etree.ElementTree as ET
+from validation_tools.lazy import lazy_import
+import threading
+
+mi = lazy_import("mitsuba")
+
+# Tags of Mitsuba properties whose values can be updated through mi.traverse
+UPDATABLE_TAGS = {"float", "rgb"}
+
+
+def parse_value(tag, value):
+    if tag == "rgb":
+        return [float(v) for v in value.replace(",", " ").split()]
+    return [float(value)]
+
+
+class MitsubaSweepRenderer:
+    """
+    Render a sequence of Mitsuba scenes that mostly differ in parameter values.
+
+    The first scene is loaded with `mi.load_file`. Every following scene is
+    compared with the scene that is currently loaded. If they only differ in
+    values of BSDF/emitter/texture properties and the sample count, the
+    changed values are applied through `mi.traverse` and the loaded scene is
+    rendered again. Any other difference reloads the scene from its XML.
+
+    With a JIT variant such as `llvm_ad_rgb`, the compiled rendering kernels
+    are reused across all scenes of a sweep.
+
+    Objects need an `id` (see `object_ids` of `convert_scene`) for their
+    parameters to be updatable.
+    """
+
+    def __init__(self):
+        self.scene = None
+        self.params = None
+        self.root = None
+        self.lock = threading.Lock()
+        self.reloads = 0
+        self.updates = 0
+
+    def render(self, scene_file):
+        """Render the Mitsuba scene file and return the image."""
+        root = ET.parse(scene_file).getroot()
+        with self.lock:
+            changes = {} if self.scene is not None else None
+            if changes is not None and not self.__diff(self.root, root, [], changes):
+                changes = None
+
+            if changes is None:
+                self.scene = mi.load_file(scene_file)
+                self.params = mi.traverse(self.scene)
+                self.reloads += 1
+            elif changes:
+                for key, values in changes.items():
+                    self.params[key] = type(self.params[key])(*values)
+                self.params.update()
+                self.updates += 1
+            self.root = root
+
+            return mi.render(self.scene, spp=self.__sample_count(root))
+
+    def __sample_count(self, root):
+        for tag in root.iter("integer"):
+            if tag.get("name") == "sample_count":
+                return int(tag.get("value"))
+        return None
+
+    def __param_key(self, path, tag):
+        """Return the mi.traverse key of a property, or None if it has none."""
+        top = path[0]
+        if top.get("id") is None:
+            return None
+
+        prefix = [top.get("id")]
+        for obj in path[1:]:
+            prefix.append(obj.get("name") or obj.get("id") or obj.tag)
+        prefix.append(tag.get("name"))
+        key = ".".join(prefix)
+
+        # Properties backed by a texture expose their value one level deeper
+        for candidate in (f"{key}.value", key):
+            if candidate in self.params:
+                return candidate
+        return None
+
+    def __diff(self, old, new, path, changes):
+        """
+        Collect the parameter updates that turn `old` into `new`.
+
+        Returns False if the scenes differ in a way that needs a reload.
+        """
+        if old.tag != new.tag or len(old) != len(new):
+            return False
+        if old.attrib.keys() != new.attrib.keys():
+            return False
+        for attrib in old.attrib:
+            if attrib != "value" and old.get(attrib) != new.get(attrib):
+                return False
+
+        if old.get("value") != new.get("value"):
+            if new.tag == "integer" and new.get("name") == "sample_count":
+                pass
+            elif new.tag not in UPDATABLE_TAGS or not path:
+                return False
+            else:
+                key = self.__param_key(path, new)
+                if key is None:
+                    return False
+                changes[key] = parse_value(new.tag, new.get("value"))
+
+        # The scene root itself is not part of any parameter name
+        child_path = path + [new] if new.tag != "scene" else path
+        for old_child, new_child in zip(old, new):
+            if not self.__diff(old_child, new_child, child_path, changes):
+                return False
+        return True
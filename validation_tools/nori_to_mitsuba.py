@@ -1,6 +1,14 @@
 import xml.etree.ElementTree as ET
-import xml.dom.minidom as minidom
+import argparse
+import os
 import sys
+import concurrent.futures
+
+try:
+    from validation_tools.xml_util import XmlStreamWriter, write_xml
+except ImportError:
+    # Running as a standalone script from within validation_tools
+    from xml_util import XmlStreamWriter, write_xml
 
 integrator_map = {
     "path_mis": "path",
@@ -96,34 +104,71 @@ def xml_tag(root, tag, **kwargs):
 
 
 def save_xml(root, filename):
-    xml_string = minidom.parseString(ET.tostring(root)).toprettyxml(indent="\t")
-    xml_string = "\n".join([line for line in xml_string.split("\n") if line.strip()])
-    with open(filename, "w") as f:
-        f.write(xml_string)
+    write_xml(root, filename, trailing_newline=False)
 
 
 def translate_tags(root):
     """Recursively translate Nori tags like mesh, bsdf, etc. to Mitsuba tags."""
 
     for child in root:
-        child.tag = lookup(child.tag, tag_map)
-        for attrib in child.attrib:
-            if attrib in attrib_map:
-                child.set(attrib, lookup(child.attrib[attrib], attrib_map[attrib]))
+        translate_tag(child)
+
+
+def translate_tag(tag):
+    """Translate a Nori tag and all of its children to Mitsuba tags."""
+    tag.tag = lookup(tag.tag, tag_map)
+    for attrib in tag.attrib:
+        if attrib in attrib_map:
+            tag.set(attrib, lookup(tag.attrib[attrib], attrib_map[attrib]))
 
-        translate_tags(child)
+    translate_tags(tag)
 
 
-def translate_scene(scene_file):
-    """Convert a Nori scene file into a Mitsuba scene file."""
-    nori_tree = ET.parse(scene_file)
-    nori_root = nori_tree.getroot()
+def translate_scene(scene_file, object_ids=None):
+    """
+    Convert a Nori scene file into a Mitsuba scene file.
 
-    scene_info = get_scene_info(nori_root)
+    If `object_ids` is given, the i-th object of the scene (i.e. every
+    top-level tag other than integrator, sampler and camera) gets the
+    Mitsuba id `object_ids[i]`. This gives its parameters stable names in
+    `mi.traverse`.
+    """
+    return translate_root(ET.parse(scene_file).getroot(), object_ids)
 
+
+def translate_root(nori_root, object_ids=None):
+    """
+    Convert the root element of a Nori scene into a Mitsuba scene root.
+
+    Works on scenes that only exist in memory, e.g. `scenegen.to_xml(scene.desc)`,
+    without writing and parsing the Nori XML. The objects of `nori_root` are
+    moved into the returned Mitsuba root, so `nori_root` is modified.
+    See `translate_scene` for `object_ids`.
+    """
     mitsuba_root = ET.Element("scene")
     mitsuba_root.set("version", "0.5.0")
+    translate_header(mitsuba_root, get_scene_info(nori_root))
+
+    # Translate the rest of the tags (mesh, bsdf, etc.)
+    remove_tags = ["integrator", "sampler", "camera"]
+
+    for tag in remove_tags:
+        tag_ = nori_root.find(tag)
+        if tag_ is not None:
+            nori_root.remove(tag_)
+
+    if object_ids is not None:
+        for tag, object_id in zip(nori_root, object_ids):
+            tag.set("id", object_id)
+
+    translate_tags(nori_root)
+    mitsuba_root.extend(nori_root)
 
+    return mitsuba_root
+
+
+def translate_header(mitsuba_root, scene_info):
+    """Add the Mitsuba integrator and sensor of a scene to `mitsuba_root`."""
     # Integrator
     integrator_tag = xml_tag(
         mitsuba_root,
@@ -173,37 +218,309 @@ def translate_scene(scene_file):
         sampler_tag, "integer", name="sample_count", value=scene_info["sample_count"]
     )
 
-    # Translate the rest of the tags (mesh, bsdf, etc.)
-    remove_tags = ["integrator", "sampler", "camera"]
-
-    for tag in remove_tags:
-        tag_ = nori_root.find(tag)
-        if tag_ is not None:
-            nori_root.remove(tag_)
 
-    translate_tags(nori_root)
-    mitsuba_root.extend(nori_root)
+def rebase_filenames(root, source_dir, target_dir):
+    """Make relative `filename` paths of a scene valid from `target_dir`."""
+    for tag in root.iter("string"):
+        value = tag.get("value")
+        if tag.get("name") == "filename" and value and not os.path.isabs(value):
+            path = os.path.relpath(os.path.join(source_dir, value), target_dir)
+            tag.set("value", path.replace(os.sep, "/"))
+
+
+def default_mitsuba_file(nori_file):
+    if "nori" in nori_file:
+        return nori_file.replace("nori", "mitsuba")
+    return nori_file.replace(".xml", "_mitsuba.xml")
+
+
+HEADER_TAGS = ("integrator", "sampler", "camera")
+
+
+def stream_scene(
+    nori_file, mitsuba_file, object_ids=None, source_dir=None, mesh_cache=None
+):
+    """
+    Convert a Nori scene file to a Mitsuba scene file while parsing it.
+
+    Objects are translated and written as soon as their end tag has been
+    parsed, then discarded, so memory use does not grow with the number of
+    objects in the scene. The output is identical to `convert_scene`.
+
+    Objects that appear before the integrator, sampler and camera are held
+    back until all three have been read, because the Mitsuba sensor is
+    written first. If `source_dir` is given, relative file references are
+    rebased from it to the directory of `mitsuba_file`. See `convert_scene`
+    for `mesh_cache`.
+    """
+    try:
+        _stream_scene(nori_file, mitsuba_file, object_ids, source_dir, mesh_cache)
+    except BaseException:
+        if os.path.exists(mitsuba_file):
+            os.remove(mitsuba_file)
+        raise
+
+
+def _stream_scene(nori_file, mitsuba_file, object_ids, source_dir, mesh_cache):
+    target_dir = os.path.dirname(os.path.abspath(mitsuba_file))
+    header = {}
+    pending = []
+    index = 0
+    depth = 0
+    root = None
+
+    with XmlStreamWriter(
+        mitsuba_file, "scene", {"version": "0.5.0"}, trailing_newline=False
+    ) as writer:
+
+        def write_object(tag):
+            translate_tag(tag)
+            if source_dir is not None:
+                rebase_filenames(tag, source_dir, target_dir)
+            if mesh_cache is not None:
+                mesh_cache.rewrite_scene(tag, target_dir)
+            writer.write(tag)
+
+        for event, element in ET.iterparse(nori_file, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+
+            # A complete top-level tag
+            if element.tag in HEADER_TAGS and element.tag not in header:
+                header[element.tag] = element
+                if len(header) == len(HEADER_TAGS):
+                    write_header(writer, header)
+                    for tag in pending:
+                        write_object(tag)
+                    pending = []
+            else:
+                if object_ids is not None and index < len(object_ids):
+                    element.set("id", object_ids[index])
+                index += 1
+                if len(header) == len(HEADER_TAGS):
+                    write_object(element)
+                else:
+                    pending.append(element)
+            # Drop the parsed tags, only the ones referenced above are kept
+            root.clear()
+
+        if len(header) != len(HEADER_TAGS):
+            # Fails like get_scene_info does for an incomplete scene
+            write_header(writer, header)
+
+
+def write_header(writer, header):
+    nori_root = ET.Element("scene")
+    nori_root.extend(header.values())
+    header_root = ET.Element("scene")
+    translate_header(header_root, get_scene_info(nori_root))
+    for tag in header_root:
+        writer.write(tag)
+
+
+def convert_scene(
+    nori_file,
+    mitsuba_file=None,
+    verbose=True,
+    object_ids=None,
+    streaming=False,
+    mesh_cache=None,
+):
+    """
+    Convert a Nori scene file to a Mitsuba scene file.
+
+    With `streaming=True`, the scene is converted while it is parsed (see
+    `stream_scene`), which keeps memory use flat for very large scenes.
+    With a `mesh_cache` (see `mesh_cache.MeshCache`), OBJ shapes are
+    converted to binary PLY files once, and the Mitsuba scene references
+    the cached PLY files instead.
+    """
+    if mitsuba_file is None:
+        mitsuba_file = default_mitsuba_file(nori_file)
+
+    source_dir = os.path.dirname(os.path.abspath(nori_file))
+    target_dir = os.path.dirname(os.path.abspath(mitsuba_file))
+    rebase = source_dir != target_dir
+    if streaming:
+        stream_scene(
+            nori_file,
+            mitsuba_file,
+            object_ids,
+            source_dir if rebase else None,
+            mesh_cache,
+        )
+    else:
+        mitsuba_root = translate_scene(nori_file, object_ids)
+        if rebase:
+            rebase_filenames(mitsuba_root, source_dir, target_dir)
+        if mesh_cache is not None:
+            mesh_cache.rewrite_scene(mitsuba_root, target_dir)
+        save_xml(mitsuba_root, mitsuba_file)
 
-    return mitsuba_root
+    if verbose:
+        print(f"Saved Mitsuba scene to {mitsuba_file}")
 
 
-def convert_scene(nori_file, mitsuba_file=None, verbose=True):
-    if mitsuba_file is None:
-        if "nori" in nori_file:
-            mitsuba_file = nori_file.replace("nori", "mitsuba")
+def is_nori_scene(path):
+    """Check whether an XML file is a Nori scene, without loading all of it."""
+    depth = 0
+    for event, element in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if depth == 0 and element.tag != "scene":
+                return False
+            if depth == 1 and element.tag == "camera":
+                return True
+            if depth == 0:
+                root = element
+            depth += 1
         else:
-            mitsuba_file = nori_file.replace(".xml", "_mitsuba.xml")
-
-    mitsuba_root = translate_scene(nori_file)
-    save_xml(mitsuba_root, mitsuba_file)
+            depth -= 1
+            if depth == 1:
+                root.clear()
+    return False
+
+
+def load_mesh_cache(directory):
+    try:
+        from validation_tools.mesh_cache import MeshCache
+    except ImportError:
+        # Running as a standalone script from within validation_tools
+        from mesh_cache import MeshCache
+    return MeshCache(directory)
+
+
+def _convert_batch_file(job):
+    nori_file, mitsuba_file, streaming, mesh_cache_dir = job
+    try:
+        if not is_nori_scene(nori_file):
+            return nori_file, "skipped"
+        os.makedirs(os.path.dirname(mitsuba_file) or ".", exist_ok=True)
+        mesh_cache = None
+        if mesh_cache_dir is not None:
+            mesh_cache = load_mesh_cache(mesh_cache_dir)
+        convert_scene(
+            nori_file,
+            mitsuba_file,
+            verbose=False,
+            streaming=streaming,
+            mesh_cache=mesh_cache,
+        )
+    except Exception as e:
+        return nori_file, f"{type(e).__name__}: {e}"
+    return nori_file, None
+
+
+def convert_tree(
+    input_dir,
+    output_dir=None,
+    workers=None,
+    verbose=True,
+    streaming=False,
+    mesh_cache_dir=None,
+):
+    """
+    Convert all Nori scenes in a directory tree, in parallel processes.
+
+    Every `.xml` file whose root is a Nori scene is converted. With an
+    `output_dir`, the Mitsuba scenes are written to the same relative paths
+    below it, and relative file references (meshes, textures) are rebased
+    so they still resolve. Otherwise they are written next to the Nori
+    scenes, named after the Nori file name (see `convert_scene`), and files
+    that already have "mitsuba" in their name are not converted. See
+    `convert_scene` for `streaming`. With a `mesh_cache_dir`, OBJ shapes
+    reference binary PLY files cached in that directory.
+
+    Returns the number of converted scenes and a dict of failed files and
+    their errors.
+    """
+    jobs = []
+    for directory, _, filenames in os.walk(input_dir):
+        for filename in sorted(filenames):
+            if not filename.endswith(".xml"):
+                continue
+            nori_file = os.path.join(directory, filename)
+            if output_dir is not None:
+                relative = os.path.relpath(nori_file, input_dir)
+                mitsuba_file = os.path.join(output_dir, relative)
+            elif "mitsuba" not in filename:
+                # Only the file name, so no directory of the tree is renamed
+                mitsuba_file = os.path.join(directory, default_mitsuba_file(filename))
+            else:
+                continue
+            jobs.append((nori_file, mitsuba_file, streaming, mesh_cache_dir))
+
+    converted = 0
+    failures = {}
+    workers = workers or os.cpu_count() or 1
+    # Large chunks keep the per-file overhead of the process pool low
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for nori_file, error in executor.map(
+            _convert_batch_file, jobs, chunksize=chunksize
+        ):
+            if error is None:
+                converted += 1
+            elif error != "skipped":
+                failures[nori_file] = error
 
     if verbose:
-        print(f"Saved Mitsuba scene to {mitsuba_file}")
+        for nori_file, error in failures.items():
+            print(f"Failed to convert {nori_file}: {error}")
+        print(
+            f"Converted {converted} scenes, {len(failures)} failed, "
+            f"{len(jobs) - converted - len(failures)} skipped"
+        )
+    return converted, failures
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print("Usage: python nori_to_mitsuba.py <nori_file> [<mitsuba_file>]")
-        sys.exit(1)
-
-    convert_scene(*sys.argv[1:])
+    parser = argparse.ArgumentParser(
+        description="Convert Nori scene files to Mitsuba scene files."
+    )
+    parser.add_argument("nori_file", help="Nori scene, or directory with --batch")
+    parser.add_argument("mitsuba_file", nargs="?", help="output file or directory")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="convert all Nori scenes in the directory tree of nori_file",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="convert while parsing, for very large scenes",
+    )
+    parser.add_argument(
+        "--mesh-cache",
+        metavar="DIR",
+        help="reference OBJ meshes as PLY files cached in DIR (requires Mitsuba)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes for --batch (default: number of CPUs)",
+    )
+    args = parser.parse_args()
+
+    if args.batch:
+        _, failures = convert_tree(
+            args.nori_file,
+            args.mitsuba_file,
+            args.workers,
+            streaming=args.stream,
+            mesh_cache_dir=args.mesh_cache,
+        )
+        sys.exit(1 if failures else 0)
+
+    mesh_cache = load_mesh_cache(args.mesh_cache) if args.mesh_cache else None
+    convert_scene(
+        args.nori_file, args.mitsuba_file, streaming=args.stream, mesh_cache=mesh_cache
+    )
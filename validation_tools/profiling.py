@@ -0,0 +1,146 @@
+import contextlib
+import csv
+import json
+import os
+import threading
+import time
+
+RECORD_FIELDS = ["phase", "scene", "renderer", "thread", "start", "duration"]
+
+
+class Profiler:
+    """Records the wall time of named phases, from any number of threads.
+
+    Every record has the phase name, optional scene and renderer tags, the
+    thread it ran on, its start time in seconds since the profiler was
+    created and its duration in seconds.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.records = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name, scene=None, renderer=None):
+        """Record the time spent in the `with` block as phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            record = {
+                "phase": name,
+                "scene": scene,
+                "renderer": renderer,
+                "thread": threading.current_thread().name,
+                "start": start - self.origin,
+                "duration": end - start,
+            }
+            with self.lock:
+                self.records.append(record)
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+    def summary(self):
+        """
+        Aggregate the records by phase, in order of first occurrence.
+
+        Returns a list of dicts with the phase name, number of records, total,
+        mean and maximum duration, and the total duration as a fraction of
+        the wall time covered by all records. Phases run in parallel, so
+        the fractions can add up to more than 1.
+        """
+        with self.lock:
+            records = list(self.records)
+        if not records:
+            return []
+
+        wall = max(r["start"] + r["duration"] for r in records) - min(
+            r["start"] for r in records
+        )
+        phases = {}
+        for record in records:
+            phases.setdefault(record["phase"], []).append(record["duration"])
+        return [
+            {
+                "phase": phase,
+                "count": len(durations),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "max": max(durations),
+                "share": sum(durations) / wall if wall > 0 else 0.0,
+            }
+            for phase, durations in phases.items()
+        ]
+
+    def format_summary(self):
+        rows = self.summary()
+        width = max([len("phase")] + [len(row["phase"]) for row in rows])
+        lines = [
+            f"{'phase':<{width}}  {'count':>6}  {'total s':>9}  {'mean s':>9}  "
+            f"{'max s':>9}  {'wall':>6}"
+        ]
+        for row in rows:
+            lines.append(
+                f"{row['phase']:<{width}}  {row['count']:>6}  {row['total']:>9.3f}  "
+                f"{row['mean']:>9.3f}  {row['max']:>9.3f}  {row['share']:>6.1%}"
+            )
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with self.lock:
+            records = list(self.records)
+        with open(path, "w") as f:
+            json.dump({"records": records, "summary": self.summary()}, f, indent=4)
+
+    def write_csv(self, path):
+        with self.lock:
+            records = list(self.records)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+    def write_chrome_trace(self, path):
+        """
+        Write the records in the Chrome trace event format.
+
+        Open the file in chrome://tracing or https://ui.perfetto.dev to see
+        the phases of every thread on a timeline.
+        """
+        with self.lock:
+            records = list(self.records)
+
+        threads = {}
+        events = []
+        for record in records:
+            tid = threads.setdefault(record["thread"], len(threads))
+            args = {k: record[k] for k in ("scene", "renderer") if record[k]}
+            events.append(
+                {
+                    "name": record["phase"],
+                    "cat": record["renderer"] or "suite",
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["duration"] * 1e6,
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        for name, tid in threads.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+            )
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,117 @@
+from validation_tools.file_util import atomic_path, atomic_write
+from validation_tools.lazy import lazy_import
+import json
+import os
+import shutil
+
+metrics = lazy_import("validation_tools.metrics")
+
+DEFAULT_REFERENCE_DIR = "validation/references"
+
+# Error metrics are upper bounds, SSIM is a lower bound
+DEFAULT_TOLERANCES = {"relmse": 1e-2, "ssim": 0.95}
+HIGHER_IS_BETTER = {"ssim"}
+
+# A render may take this many times as long as its reference, but at least
+# MIN_TIME_SLACK seconds longer, so short renders do not fail on jitter
+DEFAULT_TIME_BUDGET = 1.25
+MIN_TIME_SLACK = 0.5
+
+
+class ReferenceStore:
+    """Blessed reference renders of a validation suite.
+
+    References are stored as `directory/<scene>.exr`, together with the wall
+    time of the render in `directory/references.json`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = f"{directory}/references.json"
+
+        os.makedirs(directory, exist_ok=True)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+    def path(self, scene_name):
+        return f"{self.directory}/{scene_name}.exr"
+
+    def bless(self, scene_name, exr_path, render_time=None):
+        """Store `exr_path` as the reference of a scene."""
+        with atomic_path(self.path(scene_name)) as tmp_path:
+            shutil.copyfile(exr_path, tmp_path)
+        self.index[scene_name] = {"render_time": render_time}
+
+    def save(self):
+        with atomic_write(self.index_path) as f:
+            json.dump(self.index, f, indent=4)
+
+    def check(
+        self,
+        scene_name,
+        exr_path,
+        render_time=None,
+        tolerances=None,
+        time_budget=DEFAULT_TIME_BUDGET,
+    ):
+        """
+        Compare a render to the reference of a scene.
+
+        Args:
+            scene_name (str): Name of the scene.
+            exr_path (str): The new render.
+            render_time (float): Wall time of the new render in seconds, if
+                known.
+            tolerances (dict): Metric names and their bounds (see
+                `metrics.compare_images`). SSIM is a lower bound, all other
+                metrics are upper bounds.
+            time_budget (float): Maximum ratio of the new render time to the
+                reference render time.
+
+        Returns:
+            dict: The metrics, render times, whether the scene passed and the
+                reasons it failed.
+        """
+        tolerances = DEFAULT_TOLERANCES if tolerances is None else tolerances
+        result = {"scene": scene_name, "passed": True, "failures": []}
+
+        if scene_name not in self.index or not os.path.exists(self.path(scene_name)):
+            result["passed"] = False
+            result["failures"].append("no blessed reference")
+            return result
+
+        try:
+            values = metrics.compare_exr_files(exr_path, self.path(scene_name))
+        except ValueError as e:
+            result["passed"] = False
+            result["failures"].append(str(e))
+            return result
+        result.update(values)
+
+        for metric, bound in tolerances.items():
+            value = values[metric]
+            if metric in HIGHER_IS_BETTER:
+                failed = value < bound
+                relation = "is below"
+            else:
+                failed = value > bound
+                relation = "exceeds"
+            if failed:
+                result["failures"].append(
+                    f"{metric} {value:.3e} {relation} {bound:.3e}"
+                )
+
+        reference_time = self.index[scene_name]["render_time"]
+        result["render_time"] = render_time
+        result["reference_time"] = reference_time
+        if render_time is not None and reference_time is not None:
+            budget = max(reference_time * time_budget, reference_time + MIN_TIME_SLACK)
+            if render_time > budget:
+                result["failures"].append(
+                    f"render time {render_time:.2f}s exceeds budget {budget:.2f}s"
+                )
+
+        result["passed"] = not result["failures"]
+        return result
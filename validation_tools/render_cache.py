@@ -0,0 +1,163 @@
+from validation_tools.file_util import atomic_path, atomic_write
+import xml.etree.ElementTree as ET
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+DEFAULT_CACHE_DIR = "validation/cache/renders"
+DEFAULT_CACHE_SIZE = 10 * 1024**3
+
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file, memoized on its size and mtime."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        if memo_key in _digest_memo:
+            return _digest_memo[memo_key]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def referenced_files(xml_path):
+    """Return the files referenced by `<string name="filename">` tags of a scene.
+
+    Relative paths are resolved against the directory of the scene file, like
+    Nori and Mitsuba do.
+    """
+    scene_dir = os.path.dirname(xml_path)
+    files = []
+    for tag in ET.parse(xml_path).getroot().iter("string"):
+        if tag.get("name") == "filename":
+            files.append((tag.get("value"), os.path.join(scene_dir, tag.get("value"))))
+    return files
+
+
+def scene_key(xml_path, fingerprint):
+    """Compute the cache key of a scene file for the given renderer fingerprint.
+
+    The key covers the scene XML, the contents of every file it references
+    and the renderer fingerprint, but not the name of the scene file.
+    """
+    sha = hashlib.sha256()
+    sha.update(fingerprint.encode())
+    with open(xml_path, "rb") as f:
+        sha.update(f.read())
+    for value, path in referenced_files(xml_path):
+        digest = file_digest(path) if os.path.exists(path) else "missing"
+        sha.update(f"\0{value}\0{digest}".encode())
+    return sha.hexdigest()
+
+
+class RenderCache:
+    """A persistent, content-addressed cache of rendered images.
+
+    Entries are stored in `directory/<key>/` and evicted in least recently
+    used order once the total size exceeds `max_size` bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.index_path = f"{directory}/index.json"
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.index = self.__load_index()
+
+    def __load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Drop entries whose files have been removed behind our back
+        return {
+            key: entry
+            for key, entry in index.items()
+            if os.path.isdir(f"{self.directory}/{key}")
+        }
+
+    def __save_index(self):
+        with atomic_write(self.index_path) as f:
+            json.dump(self.index, f, indent=1)
+
+    def __entry_path(self, key, output_path):
+        ext = os.path.splitext(output_path)[1]
+        return f"{self.directory}/{key}/render{ext}"
+
+    def get(self, key, output_paths):
+        """
+        Restore a cached render to `output_paths`.
+
+        Returns the metadata stored with the entry, or None on a cache miss.
+        """
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            try:
+                for output_path in output_paths:
+                    shutil.copyfile(self.__entry_path(key, output_path), output_path)
+            except FileNotFoundError:
+                self.__remove(key)
+                self.__save_index()
+                return None
+            entry["last_used"] = time.time()
+            self.__save_index()
+            return entry["metadata"]
+
+    def put(self, key, output_paths, **metadata):
+        """Store freshly rendered `output_paths` under `key`."""
+        entry_dir = f"{self.directory}/{key}"
+        os.makedirs(entry_dir, exist_ok=True)
+        size = 0
+        for output_path in output_paths:
+            entry_path = self.__entry_path(key, output_path)
+            # Concurrent puts of a key never mix
+            with atomic_path(entry_path) as tmp_path:
+                shutil.copyfile(output_path, tmp_path)
+            size += os.path.getsize(entry_path)
+
+        with self.lock:
+            self.index[key] = {
+                "size": size,
+                "last_used": time.time(),
+                "metadata": metadata,
+            }
+            self.__evict()
+            self.__save_index()
+
+    def __remove(self, key):
+        self.index.pop(key, None)
+        shutil.rmtree(f"{self.directory}/{key}", ignore_errors=True)
+
+    def __evict(self):
+        total = sum(entry["size"] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]["last_used"]):
+            if total <= self.max_size:
+                break
+            total -= self.index[key]["size"]
+            self.__remove(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.index):
+                self.__remove(key)
+            self.__save_index()
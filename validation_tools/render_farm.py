@@ -0,0 +1,540 @@
+import xml.etree.ElementTree as ET
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+try:
+    from validation_tools.file_util import atomic_write
+    from validation_tools.lazy import lazy_import, module_version
+    from validation_tools.render_cache import file_digest
+    from validation_tools.render_server import VariantGate
+except ImportError:
+    from file_util import atomic_write
+    from lazy import lazy_import, module_version
+    from render_cache import file_digest
+    from render_server import VariantGate
+
+mi = lazy_import("mitsuba")
+
+DEFAULT_PORT = 7341
+DEFAULT_WORK_DIR = "validation/farm"
+# Workers report progress at this interval while rendering, so coordinators
+# can tell a long render from a lost worker
+HEARTBEAT_INTERVAL = 5.0
+DEFAULT_TIMEOUT = 60.0
+OUTPUT_EXTENSIONS = [".png", ".exr"]
+# Assets are named by the SHA-256 of their contents and their extension
+ASSET_NAME = re.compile(r"[0-9a-f]{64}(\.[A-Za-z0-9]+)?")
+
+
+class RenderFarmError(RuntimeError):
+    pass
+
+
+class WorkerLostError(ConnectionError):
+    """The connection to a worker failed, so its job can be re-queued."""
+
+
+def send_message(f, message, blobs=()):
+    """Send a JSON message line followed by the raw bytes of `blobs`."""
+    message = dict(message, sizes=[len(blob) for blob in blobs])
+    f.write(json.dumps(message).encode() + b"\n")
+    for blob in blobs:
+        f.write(blob)
+    f.flush()
+
+
+def recv_message(f):
+    """Receive a message sent by `send_message`, returns (message, blobs)."""
+    line = f.readline()
+    if not line:
+        raise ConnectionError("Connection closed.")
+    message = json.loads(line)
+    blobs = []
+    for size in message.pop("sizes", []):
+        blob = f.read(size)
+        if len(blob) != size:
+            raise ConnectionError("Connection closed.")
+        blobs.append(blob)
+    return message, blobs
+
+
+def pack_scene(scene_file):
+    """
+    Prepare a scene file for rendering on a worker.
+
+    Every file referenced by a `<string name="filename">` tag becomes an
+    asset named after the SHA-256 of its contents, so workers store each
+    mesh once no matter how many scenes or suites use it.
+
+    Returns:
+        tuple: The scene XML with file references pointing at the worker's
+            asset directory, and a dict mapping asset names to local paths.
+    """
+    scene_dir = os.path.dirname(scene_file)
+    root = ET.parse(scene_file).getroot()
+    assets = {}
+    for tag in root.iter("string"):
+        if tag.get("name") != "filename":
+            continue
+        path = os.path.join(scene_dir, tag.get("value"))
+        if not os.path.exists(path):
+            continue
+        name = file_digest(path) + os.path.splitext(path)[1]
+        assets[name] = path
+        tag.set("value", f"../assets/{name}")
+    return ET.tostring(root, encoding="unicode"), assets
+
+
+class WorkerConnection:
+    """Connection of a coordinator to one worker agent."""
+
+    def __init__(self, address, timeout=DEFAULT_TIMEOUT):
+        host, port = address.rsplit(":", 1)
+        self.address = address
+        self.sock = socket.create_connection((host, int(port)), timeout=timeout)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.file = self.sock.makefile("rwb")
+        self.status = self.request({"op": "hello"})
+
+    def request(self, message, blobs=()):
+        self.send(message, blobs)
+        return self.receive()[0]
+
+    def send(self, message, blobs=()):
+        try:
+            send_message(self.file, message, blobs)
+        except (OSError, ValueError) as e:
+            raise WorkerLostError(str(e)) from e
+
+    def receive(self):
+        while True:
+            try:
+                message, blobs = recv_message(self.file)
+            except (OSError, ValueError) as e:
+                raise WorkerLostError(str(e)) from e
+            if not message["ok"]:
+                raise RenderFarmError(f"{self.address}: {message['error']}")
+            if not message.get("heartbeat"):
+                return message, blobs
+
+    def render(self, scene_file, outputs, renderer, variant):
+        """
+        Render a scene on the worker and write its outputs as they arrive.
+
+        Args:
+            scene_file (str): Nori or Mitsuba scene XML.
+            outputs (dict): Maps the extensions of the renders (".png", ".exr")
+                to the local paths they are written to.
+            renderer (str): "nori" or "mitsuba".
+            variant (str): Mitsuba variant, used by Mitsuba jobs.
+
+        Returns:
+            dict: Render time on the worker in seconds and the console output
+                of the renderer.
+        """
+        scene_xml, assets = pack_scene(scene_file)
+        job = {
+            "op": "render",
+            "renderer": renderer,
+            "variant": variant,
+            "scene": scene_xml,
+            "assets": sorted(assets),
+        }
+        missing = self.request(job)["missing"]
+        blobs = []
+        try:
+            for name in missing:
+                with open(assets[name], "rb") as f:
+                    blobs.append(f.read())
+        except OSError:
+            # Cancel the job, so the connection can be used for the next one
+            self.request({"op": "assets", "names": [], "abort": True})
+            raise
+        self.send({"op": "assets", "names": missing}, blobs)
+
+        error = None
+        while True:
+            message, blobs = self.receive()
+            if "output" not in message:
+                if error is not None:
+                    raise error
+                return message
+            if error is not None:
+                continue
+            try:
+                # Never leave a partial render behind if the worker is lost
+                with atomic_write(outputs[message["output"]], "wb") as f:
+                    f.write(blobs[0])
+            except OSError as e:
+                # Receive the rest of the job, so the connection stays usable
+                error = e
+
+    def close(self):
+        with contextlib.suppress(OSError):
+            self.file.close()
+            self.sock.close()
+
+
+class RenderFarm:
+    """Dispatches render jobs to a pool of worker agents over TCP.
+
+    Each worker renders one job at a time. Jobs of a worker that disconnects
+    or stops responding are re-queued on the remaining workers.
+    """
+
+    def __init__(self, addresses, timeout=DEFAULT_TIMEOUT):
+        self.addresses = list(addresses)
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.workers = []
+        self.idle = []
+        self.connect()
+
+    def connect(self):
+        """Connect to all workers that are not connected, e.g. after a loss."""
+        connected = {worker.address for worker in self.workers}
+        for address in self.addresses:
+            if address in connected:
+                continue
+            try:
+                worker = WorkerConnection(address, self.timeout)
+            except (OSError, ValueError, RenderFarmError) as e:
+                print(f"Could not connect to farm worker {address}: {e}")
+                continue
+            with self.condition:
+                self.workers.append(worker)
+                self.idle.append(worker)
+                self.condition.notify_all()
+        if not self.workers:
+            raise RenderFarmError("No render farm worker is reachable.")
+
+    @property
+    def size(self):
+        return len(self.workers)
+
+    def fingerprint(self, renderer):
+        """Versions of `renderer` on the workers, as used for render cache keys."""
+        return " ".join(sorted({worker.status[renderer] for worker in self.workers}))
+
+    def render(self, scene_file, outputs, renderer, variant):
+        """
+        Render a scene on the next free worker, see `WorkerConnection.render`.
+
+        Returns:
+            tuple: The address of the worker that rendered the scene and its
+                result.
+        """
+        while True:
+            worker = self.__acquire()
+            try:
+                result = worker.render(scene_file, outputs, renderer, variant)
+            except WorkerLostError as e:
+                self.__lose(worker)
+                print(f"Lost farm worker {worker.address} ({e}), re-queueing job")
+                continue
+            except Exception:
+                # Failed renders and local I/O errors are not the worker's fault
+                self.__release(worker)
+                raise
+            self.__release(worker)
+            return worker.address, result
+
+    def __acquire(self):
+        with self.condition:
+            while not self.idle:
+                if not self.workers:
+                    raise RenderFarmError("All render farm workers were lost.")
+                self.condition.wait()
+            return self.idle.pop()
+
+    def __release(self, worker):
+        with self.condition:
+            self.idle.append(worker)
+            self.condition.notify_all()
+
+    def __lose(self, worker):
+        worker.close()
+        with self.condition:
+            self.workers.remove(worker)
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            for worker in self.workers:
+                worker.close()
+            self.workers = []
+            self.idle = []
+
+
+class _WorkerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.write_lock = threading.Lock()
+        while True:
+            try:
+                message, _ = recv_message(self.rfile)
+            except (OSError, ValueError):
+                return
+            try:
+                if message["op"] == "hello":
+                    self.send(self.server.status())
+                elif message["op"] == "render":
+                    self.server.run_job(message, self)
+                else:
+                    raise ValueError(f"Unknown operation {message['op']}.")
+            except Exception as e:
+                self.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+    def send(self, message, blobs=()):
+        with self.write_lock:
+            send_message(self.wfile, message, blobs)
+
+    def receive(self):
+        return recv_message(self.rfile)
+
+    @contextlib.contextmanager
+    def heartbeat(self):
+        """Send heartbeats to the coordinator while the block runs."""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(HEARTBEAT_INTERVAL):
+                try:
+                    self.send({"ok": True, "heartbeat": True})
+                except OSError:
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+
+class RenderWorker(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """A worker agent that renders jobs sent by `RenderFarm` coordinators.
+
+    Assets are stored in `directory/assets` under their content hash and
+    kept across jobs. Job files are written to `directory/jobs` and removed
+    once the outputs are sent.
+
+    Workers are not authenticated: anyone who can connect can render scenes,
+    and scenes can read any file the worker can. Only run workers on a
+    trusted network.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=DEFAULT_PORT,
+        directory=DEFAULT_WORK_DIR,
+        nori_executable="./build/nori",
+    ):
+        self.asset_directory = f"{directory}/assets"
+        self.job_directory = f"{directory}/jobs"
+        self.nori_executable = nori_executable
+        self.gate = VariantGate(mi)
+        self.jobs = 0
+        os.makedirs(self.asset_directory, exist_ok=True)
+        os.makedirs(self.job_directory, exist_ok=True)
+        super().__init__((host, port), _WorkerHandler)
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def status(self):
+        if os.path.exists(self.nori_executable):
+            nori = f"nori {file_digest(self.nori_executable)}"
+        else:
+            nori = "nori missing"
+        return {
+            "ok": True,
+            "pid": os.getpid(),
+            "nori": nori,
+            "mitsuba": f"mitsuba {module_version('mitsuba')}",
+            "jobs": self.jobs,
+        }
+
+    def run_job(self, job, handler):
+        missing = [
+            name
+            for name in job["assets"]
+            if not os.path.exists(self.__asset_path(name))
+        ]
+        handler.send({"ok": True, "missing": missing})
+        message, blobs = handler.receive()
+        if message.get("abort"):
+            # The coordinator could not read an asset
+            handler.send({"ok": True, "aborted": True})
+            return
+        for name, data in zip(message["names"], blobs):
+            self.__store_asset(name, data)
+
+        # Named by the worker, so no path sent by a client is ever written
+        base = f"{self.job_directory}/{uuid.uuid4().hex}"
+        with open(f"{base}.xml", "w") as f:
+            f.write(job["scene"])
+        try:
+            start = time.perf_counter()
+            with handler.heartbeat():
+                if job["renderer"] == "nori":
+                    log = self.__render_nori(base)
+                else:
+                    log = self.__render_mitsuba(base, job["variant"])
+            render_time = time.perf_counter() - start
+
+            for extension in OUTPUT_EXTENSIONS:
+                with open(f"{base}{extension}", "rb") as f:
+                    handler.send({"ok": True, "output": extension}, [f.read()])
+            self.jobs += 1
+            handler.send({"ok": True, "render_time": render_time, "log": log})
+        finally:
+            for extension in [".xml"] + OUTPUT_EXTENSIONS:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(f"{base}{extension}")
+
+    def __asset_path(self, name):
+        if not isinstance(name, str) or not ASSET_NAME.fullmatch(name):
+            raise ValueError(f"Invalid asset name {name!r}.")
+        return f"{self.asset_directory}/{name}"
+
+    def __store_asset(self, name, data):
+        path = self.__asset_path(name)
+        if hashlib.sha256(data).hexdigest() != name.split(".")[0]:
+            raise ValueError(f"Asset {name} does not match its hash.")
+        with atomic_write(path, "wb") as f:
+            f.write(data)
+
+    def __render_nori(self, base):
+        result = subprocess.run(
+            [self.nori_executable, "-b", f"{base}.xml"],
+            capture_output=True,
+            text=True,
+        )
+        if not all(os.path.exists(f"{base}{ext}") for ext in OUTPUT_EXTENSIONS):
+            raise RenderFarmError(f"Nori failed: {result.stderr}")
+        return result.stdout + result.stderr
+
+    def __render_mitsuba(self, base, variant):
+        with self.gate.use(variant):
+            scene = mi.load_file(f"{base}.xml")
+            image = mi.render(scene)
+            for extension in OUTPUT_EXTENSIONS:
+                mi.util.write_bitmap(f"{base}{extension}", image, write_async=False)
+        return ""
+
+
+@contextlib.contextmanager
+def launch_local_workers(
+    count, nori_executable="./build/nori", directory=DEFAULT_WORK_DIR, timeout=60.0
+):
+    """
+    Start worker agents on localhost for testing, yields their addresses.
+
+    Every worker runs in its own process on a free port and logs to
+    `directory/worker_<i>.log`. The workers are stopped when the block exits.
+    """
+    os.makedirs(directory, exist_ok=True)
+    processes = []
+    log_paths = []
+    try:
+        for i in range(count):
+            log_paths.append(f"{directory}/worker_{i}.log")
+            with open(log_paths[-1], "w") as log:
+                processes.append(
+                    subprocess.Popen(
+                        [
+                            sys.executable,
+                            os.path.abspath(__file__),
+                            "--port",
+                            "0",
+                            "--directory",
+                            directory,
+                            "--nori",
+                            nori_executable,
+                        ],
+                        stdout=log,
+                        stderr=subprocess.STDOUT,
+                    )
+                )
+
+        addresses = []
+        deadline = time.time() + timeout
+        for process, log_path in zip(processes, log_paths):
+            while True:
+                with open(log_path) as log:
+                    lines = log.read().splitlines()
+                listening = [line for line in lines if "listening at" in line]
+                if listening:
+                    addresses.append(listening[0].rsplit(" ", 1)[1])
+                    break
+                if process.poll() is not None or time.time() > deadline:
+                    raise RenderFarmError(
+                        "Farm worker did not start:\n" + "\n".join(lines)
+                    )
+                time.sleep(0.05)
+        yield addresses
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render farm worker agent for validation suites."
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="interface to listen on, 0.0.0.0 for all; workers are not "
+        "authenticated, only listen on trusted networks (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"port to listen on, 0 for any free port (default: {DEFAULT_PORT})",
+    )
+    parser.add_argument(
+        "--directory",
+        default=DEFAULT_WORK_DIR,
+        help=f"directory for assets and jobs (default: {DEFAULT_WORK_DIR})",
+    )
+    parser.add_argument(
+        "--nori",
+        default="./build/nori",
+        help="path of the Nori executable (default: ./build/nori)",
+    )
+    args = parser.parse_args()
+
+    worker = RenderWorker(args.host, args.port, args.directory, args.nori)
+    print(f"Render farm worker listening at {worker.address}", flush=True)
+    with worker:
+        try:
+            worker.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    print("Render farm worker stopped")
+
+
+if __name__ == "__main__":
+    main()
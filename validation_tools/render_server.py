@@ -0,0 +1,248 @@
+import argparse
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+DEFAULT_SOCKET_PATH = "validation/render_server.sock"
+DEFAULT_VARIANTS = ["scalar_rgb"]
+
+
+class RenderServerError(RuntimeError):
+    pass
+
+
+class RenderClient:
+    """Submits render jobs to a running render server.
+
+    Every request opens its own connection, so a client can be shared by
+    several threads.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH):
+        self.socket_path = socket_path
+
+    def request(self, message, timeout=None):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(message).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        if not line:
+            raise RenderServerError("Render server closed the connection.")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RenderServerError(response["error"])
+        return response
+
+    def ping(self, timeout=1.0):
+        """Return the server status, or None if no server is running."""
+        if not os.path.exists(self.socket_path):
+            return None
+        try:
+            return self.request({"op": "ping"}, timeout=timeout)
+        except (OSError, ValueError, RenderServerError):
+            return None
+
+    def render(self, scene_file, output_paths, variant, spp=None, seed=0):
+        """
+        Render a Mitsuba scene file on the server.
+
+        Args:
+            scene_file (str): Mitsuba scene XML. File references are resolved
+                relative to it.
+            output_paths (list of str): Images to write, e.g. a PNG and an EXR
+                path.
+            variant (str): Mitsuba variant to render with.
+            spp (int): Overrides the sample count of the scene.
+            seed (int): Seed of the sampler.
+
+        Returns:
+            float: Wall time of the render on the server in seconds.
+        """
+        response = self.request(
+            {
+                "op": "render",
+                "scene": os.path.abspath(scene_file),
+                "outputs": [os.path.abspath(path) for path in output_paths],
+                "variant": variant,
+                "spp": spp,
+                "seed": seed,
+            }
+        )
+        return response["render_time"]
+
+    def shutdown(self):
+        self.request({"op": "shutdown"})
+
+
+class VariantGate:
+    """Lets jobs of the current Mitsuba variant run concurrently.
+
+    `mi.set_variant` is global to the process, so a job that needs a
+    different variant waits until all running jobs are done.
+    """
+
+    def __init__(self, mi):
+        self.mi = mi
+        self.condition = threading.Condition()
+        self.variant = None
+        self.active = 0
+
+    @contextlib.contextmanager
+    def use(self, variant):
+        with self.condition:
+            while self.active and self.variant != variant:
+                self.condition.wait()
+            if self.variant != variant:
+                self.mi.set_variant(variant)
+                self.variant = variant
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.handle_message(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A long-lived process that keeps Mitsuba loaded and renders scene files."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, variants=DEFAULT_VARIANTS):
+        import mitsuba as mi
+
+        self.mi = mi
+        self.gate = VariantGate(mi)
+        self.jobs = 0
+        self.started = time.time()
+        self.warm_variants = []
+        self.socket_path = socket_path
+
+        if os.path.exists(socket_path):
+            if RenderClient(socket_path).ping() is not None:
+                raise RenderServerError(
+                    f"A render server is already running at {socket_path}."
+                )
+            # Left behind by a server that did not shut down cleanly
+            os.remove(socket_path)
+        for variant in variants:
+            self.warm_up(variant)
+
+        super().__init__(socket_path, _RequestHandler)
+
+    def warm_up(self, variant):
+        """Initialize a variant and compile its kernels with a tiny render."""
+        mi = self.mi
+        with self.gate.use(variant):
+            scene = mi.load_dict(
+                {
+                    "type": "scene",
+                    "integrator": {"type": "path"},
+                    "sensor": {
+                        "type": "perspective",
+                        "film": {"type": "hdrfilm", "width": 8, "height": 8},
+                    },
+                    "shape": {"type": "sphere"},
+                    "emitter": {"type": "constant"},
+                }
+            )
+            mi.render(scene, spp=1)
+        self.warm_variants.append(variant)
+        print(f"Warmed up variant {variant}", flush=True)
+
+    def handle_message(self, message):
+        op = message["op"]
+        if op == "ping":
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "version": self.mi.__version__,
+                "jobs": self.jobs,
+                "uptime": time.time() - self.started,
+                "variants": self.warm_variants,
+            }
+        if op == "render":
+            return {"ok": True, "render_time": self.render(message)}
+        if op == "shutdown":
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True}
+        raise ValueError(f"Unknown operation {op}.")
+
+    def render(self, job):
+        mi = self.mi
+        start = time.perf_counter()
+        with self.gate.use(job["variant"]):
+            scene = mi.load_file(job["scene"])
+            image = mi.render(scene, spp=job["spp"] or 0, seed=job["seed"])
+            for path in job["outputs"]:
+                mi.util.write_bitmap(path, image, write_async=False)
+        with self.gate.condition:
+            self.jobs += 1
+        return time.perf_counter() - start
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep Mitsuba loaded and render scenes for validation suites."
+    )
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help=f"path of the unix socket (default: {DEFAULT_SOCKET_PATH})",
+    )
+    parser.add_argument(
+        "--variant",
+        action="append",
+        help="variant to warm up at startup, can be repeated (default: scalar_rgb)",
+    )
+    parser.add_argument(
+        "--stop", action="store_true", help="stop the server running at --socket"
+    )
+    args = parser.parse_args()
+
+    if args.stop:
+        RenderClient(args.socket).shutdown()
+        print(f"Stopped render server at {args.socket}")
+        return
+
+    try:
+        server = RenderServer(args.socket, args.variant or DEFAULT_VARIANTS)
+    except RenderServerError as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Render server listening at {args.socket}", flush=True)
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    print("Render server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import xml.etree.ElementTree as ET
-import xml.dom.minidom as minidom
+import io
+from validation_tools.xml_util import write_xml
 
 
 class xmltag:
@@ -13,6 +14,8 @@ class xmltag:
             self.children = kwargs["children"]
         self.kwargs = kwargs
         self.kwargs.pop("children", None)
+        # Token of the scene that may modify this tag in place (see Scene.copy)
+        self.owner = None
 
     def contains_child(self, tagname):
         for child in self.children:
@@ -29,6 +32,12 @@ class xmltag:
     def add_child(self, tag):
         self.children.append(tag)
 
+    def copy(self):
+        """Return a shallow copy of the tag that shares its children."""
+        tag = xmltag(self.tagname, **self.kwargs)
+        tag.children = list(self.children)
+        return tag
+
     def __str__(self) -> str:
         kwarg_str = " ".join([f"{attr}={value}" for attr, value in self.kwargs.items()])
         children_str = "\n".join([str(child) for child in self.children])
@@ -55,22 +64,54 @@ def to_xml(scene):
 
 
 class Scene:
+    """
+    A scene description made of named top-level tags.
+
+    Copies of a scene share their tags. Tags are copied on write: before a
+    scene modifies a tag it does not own, it replaces the tag (and the path
+    of parent tags leading to it) with shallow copies. A copy therefore only
+    costs memory proportional to what it changes, while modifications never
+    leak into other copies.
+    """
+
     def __init__(self, name, desc):
         self.name = name
         self.desc = desc
+        self.token = object()
+
+    def __own(self, tag):
+        """Return `tag` if this scene owns it, otherwise an owned copy of it."""
+        if tag.owner is self.token:
+            return tag
+        tag = tag.copy()
+        tag.owner = self.token
+        return tag
+
+    def __edit_object(self, name):
+        tag = self.__own(self.desc[name])
+        self.desc[name] = tag
+        return tag
+
+    def __edit_child(self, tag, index):
+        child = self.__own(tag.children[index])
+        tag.children[index] = child
+        return child
 
     def set_integrator(self, integrator):
-        self.desc["integrator"].kwargs["type"] = integrator
+        self.__edit_object("integrator").kwargs["type"] = integrator
 
     def set_spp(self, spp):
-        self.desc["sampler"].children[0].kwargs["value"] = str(spp)
+        sampler = self.__edit_object("sampler")
+        self.__edit_child(sampler, 0).kwargs["value"] = str(spp)
 
     def set_resolution(self, width, height):
-        self.desc["camera"].children[2].kwargs["value"] = str(width)
-        self.desc["camera"].children[3].kwargs["value"] = str(height)
+        camera = self.__edit_object("camera")
+        self.__edit_child(camera, 2).kwargs["value"] = str(width)
+        self.__edit_child(camera, 3).kwargs["value"] = str(height)
 
     def set_fov(self, fov):
-        self.desc["camera"].children[0].kwargs["value"] = str(fov)
+        camera = self.__edit_object("camera")
+        self.__edit_child(camera, 0).kwargs["value"] = str(fov)
 
     def set_quality(self, quality):
         """
@@ -117,6 +158,7 @@ class Scene:
         if name in self.desc:
             raise ValueError(f"Object with name {name} already exists in the scene.")
         tag_ = xmltag(tag, **kwargs)
+        tag_.owner = self.token
         self.desc[name] = tag_
 
     def remove_object(self, name):
@@ -130,9 +172,16 @@ class Scene:
         self.desc[name] = obj
 
     def get_object(self, name):
+        """
+        Return the top-level tag of an object for modification.
+
+        The tag is owned by this scene, so modifying its attributes or its
+        list of children does not affect copies of the scene. Nested tags are
+        still shared and should be replaced rather than modified.
+        """
         if name not in self.desc:
             raise ValueError(f"Object with name {name} does not exist in the scene.")
-        return self.desc[name]
+        return self.__edit_object(name)
 
     def set_bsdf(self, object, bsdf):
         obj = self.get_object(object)
@@ -157,10 +206,19 @@ class Scene:
 
     def generate(self):
         """Generate the scene XML and return it as a string."""
-        xml = to_xml(self.desc)
-        return minidom.parseString(ET.tostring(xml)).toprettyxml(indent="\t")
+        stream = io.StringIO()
+        self.write(stream)
+        return stream.getvalue()
+
+    def write(self, file):
+        """Write the scene XML to a path or text stream in a single pass."""
+        write_xml(xmltag("scene", children=list(self.desc.values())), file)
 
     def copy(self):
+        """Return a copy of the scene that shares all tags until they are modified."""
+        # Both scenes lose ownership of the shared tags, so either of them
+        # copies a tag before its first modification
+        self.token = object()
         return Scene(self.name, self.desc.copy())
 
 
@@ -0,0 +1,64 @@
+import itertools
+import math
+
+
+class Sweep:
+    """
+    A lazy cartesian product of scene parameters.
+
+    Each axis is a name and a sequence of values. The axes "integrator",
+    "spp" and "quality" are applied with the corresponding `Scene` setters.
+    The values of all other axes are passed as keyword arguments to
+    `apply(scene, **values)`, which modifies the scene variant.
+
+    Variants are only created while iterating, one combination at a time.
+    """
+
+    BUILTIN_AXES = {
+        "integrator": lambda scene, value: scene.set_integrator(value),
+        "spp": lambda scene, value: scene.set_spp(value),
+        "quality": lambda scene, value: scene.set_quality(value),
+    }
+
+    def __init__(self, suite, scene, apply=None, label=None, **axes):
+        self.suite = suite
+        self.scene = scene.copy()
+        self.apply = apply
+        self.label = label
+        # Axis values are materialized (e.g. color_range generators), variants are not
+        self.axes = {name: tuple(values) for name, values in axes.items()}
+
+        custom_axes = [name for name in self.axes if name not in self.BUILTIN_AXES]
+        if custom_axes and apply is None:
+            raise ValueError(f"Axes {custom_axes} need an apply function.")
+
+    def __len__(self):
+        return math.prod(len(values) for values in self.axes.values())
+
+    def __iter__(self):
+        """Yield (scene, label) for every combination of axis values."""
+        for combination in itertools.product(*self.axes.values()):
+            params = dict(zip(self.axes, combination))
+
+            scene = self.scene.copy()
+            custom = {}
+            for name, value in params.items():
+                if name in self.BUILTIN_AXES:
+                    self.BUILTIN_AXES[name](scene, value)
+                else:
+                    custom[name] = value
+            if self.apply is not None:
+                self.apply(scene, **custom)
+
+            yield scene, self.__make_label(params)
+
+    def __make_label(self, params):
+        if self.label is None:
+            return ""
+        if callable(self.label):
+            return self.label(**params)
+        return self.label.format(**params)
+
+    def run(self, **kwargs):
+        """Register, render and grid all variants. See `ValidationSuite.render_stream`."""
+        self.suite.render_stream(iter(self), len(self), **kwargs)
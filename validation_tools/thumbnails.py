@@ -0,0 +1,131 @@
+from validation_tools.file_util import atomic_write
+from validation_tools.lazy import lazy_import
+import os
+import zipfile
+
+np = lazy_import("numpy")
+cv2 = lazy_import("cv2")
+exr_util = lazy_import("validation_tools.exr_util")
+metrics = lazy_import("validation_tools.metrics")
+Image = lazy_import("PIL.Image")
+
+# Largest side of the biggest pyramid level that is stored
+DEFAULT_MAX_SIZE = 256
+# Levels are halved until their smaller side would drop below this
+MIN_SIZE = 8
+
+
+def build_pyramid(img, max_size=DEFAULT_MAX_SIZE):
+    """
+    Halve an image with area averaging until it is smaller than `MIN_SIZE`.
+
+    Returns:
+        list of np.ndarray: The levels whose largest side is at most
+            `max_size`, largest first. Includes `img` itself if it is small
+            enough.
+    """
+    levels = []
+    level = img
+    while True:
+        height, width = level.shape[:2]
+        if max(width, height) <= max_size:
+            levels.append(level)
+        if min(width, height) < 2 * MIN_SIZE:
+            return levels
+        level = cv2.resize(
+            level,
+            ((width + 1) // 2, (height + 1) // 2),
+            interpolation=cv2.INTER_AREA,
+        )
+
+
+def resize_cell(img, resolution):
+    """Resize an image to a square cell, area averaging when downsampling."""
+    height, width = img.shape[:2]
+    if (width, height) == (resolution, resolution):
+        return img
+    downsampling = width >= resolution and height >= resolution
+    interpolation = cv2.INTER_AREA if downsampling else cv2.INTER_CUBIC
+    return cv2.resize(img, (resolution, resolution), interpolation=interpolation)
+
+
+def choose_level(shapes, full_shape, resolution):
+    """
+    Index of the smallest pyramid level that covers a cell.
+
+    Returns None if the cell should be resized from the render itself, i.e.
+    if it is larger than every stored level and the largest stored level is
+    smaller than the render.
+    """
+    for i in reversed(range(len(shapes))):
+        height, width = shapes[i][:2]
+        if width >= resolution and height >= resolution:
+            return i
+    if len(shapes) and tuple(shapes[0][:2]) == tuple(full_shape[:2]):
+        return 0
+    return None
+
+
+def srgb_cell(img):
+    """Convert a linear RGB cell to an 8-bit sRGB image, like the PNG renders."""
+    return Image.fromarray(np.round(metrics.to_display(img) * 255).astype(np.uint8))
+
+
+class ThumbnailCache:
+    """Downsampled copies of EXR renders, decoded once and reused by grids.
+
+    The first time a render is needed for a grid, its EXR is decoded once
+    and halved with area averaging into a pyramid of levels, stored as
+    `directory/<render name>.npz`. A grid cell of any resolution is then
+    resized from the smallest level that still covers it, so re-laying-out
+    a grid with other rows, columns or cell resolutions reads a few small
+    arrays instead of decoding every render again.
+
+    A pyramid records the size and modification time of its source render
+    and is rebuilt when the render changes. Cells larger than the biggest
+    stored level are resized from the render itself.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, exr_path):
+        name = os.path.splitext(os.path.basename(exr_path))[0]
+        return f"{self.directory}/{name}.npz"
+
+    def cell(self, exr_path, resolution):
+        """Return a render as a linear RGB cell of `resolution` x `resolution`."""
+        source = self.__source(exr_path)
+        try:
+            with np.load(self.path(exr_path)) as data:
+                if np.array_equal(data["source"], source):
+                    level = choose_level(data["shapes"], data["full"], resolution)
+                    if level is None:
+                        return resize_cell(exr_util.read_exr(exr_path), resolution)
+                    return resize_cell(data[f"level_{level}"], resolution)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # Missing, or written by an older version or a crashed process
+            pass
+
+        img = exr_util.read_exr(exr_path)
+        levels = build_pyramid(img, self.max_size)
+        shapes = [level.shape for level in levels]
+        self.__store(exr_path, source, levels, img.shape)
+        level = choose_level(shapes, img.shape, resolution)
+        return resize_cell(img if level is None else levels[level], resolution)
+
+    def __source(self, exr_path):
+        stat = os.stat(exr_path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def __store(self, exr_path, source, levels, full_shape):
+        path = self.path(exr_path)
+        arrays = {f"level_{i}": level for i, level in enumerate(levels)}
+        arrays["shapes"] = np.array([level.shape[:2] for level in levels])
+        arrays["full"] = np.array(full_shape[:2])
+        arrays["source"] = source
+        # Cells are loaded from several threads, never expose a partial file
+        with atomic_write(path, "wb") as f:
+            np.savez(f, **arrays)
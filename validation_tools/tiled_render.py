@@ -0,0 +1,156 @@
+import xml.etree.ElementTree as ET
+import argparse
+import copy
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from validation_tools.lazy import lazy_import
+except ImportError:
+    from lazy import lazy_import
+
+mi = lazy_import("mitsuba")
+np = lazy_import("numpy")
+exr_util = lazy_import("validation_tools.exr_util")
+
+CROP_PROPERTIES = ["crop_offset_x", "crop_offset_y", "crop_width", "crop_height"]
+# Size of an hdrfilm without width and height properties
+DEFAULT_FILM_SIZE = (768, 576)
+
+
+def tile_windows(width, height, cols, rows):
+    """
+    Split a film into crop windows that cover every pixel exactly once.
+
+    Returns:
+        list of tuple: (x, y, width, height) of every non-empty tile, in
+            row-major order.
+    """
+    xs = [width * i // cols for i in range(cols + 1)]
+    ys = [height * j // rows for j in range(rows + 1)]
+    return [
+        (xs[i], ys[j], xs[i + 1] - xs[i], ys[j + 1] - ys[j])
+        for j in range(rows)
+        for i in range(cols)
+        if xs[i + 1] > xs[i] and ys[j + 1] > ys[j]
+    ]
+
+
+def film_size(root):
+    """Return the (width, height) of the film of a Mitsuba scene element."""
+    film = next(root.iter("film"))
+    size = dict(zip(("width", "height"), DEFAULT_FILM_SIZE))
+    for child in film:
+        if child.tag == "integer" and child.get("name") in size:
+            size[child.get("name")] = int(child.get("value"))
+    return size["width"], size["height"]
+
+
+def crop_scene(root, window):
+    """Return a copy of a Mitsuba scene element that only renders `window`."""
+    root = copy.deepcopy(root)
+    film = next(root.iter("film"))
+    for child in list(film):
+        if child.get("name") in CROP_PROPERTIES:
+            film.remove(child)
+    for name, value in zip(CROP_PROPERTIES, window):
+        ET.SubElement(film, "integer", name=name, value=str(value))
+    return root
+
+
+class TiledRenderer:
+    """Renders Mitsuba scenes as tiles in separate processes and stitches them.
+
+    The film is split into `cols` x `rows` crop windows. Every tile is
+    rendered by its own Python process with its own seed, then copied into
+    an image of the full film size, so the result has the same size,
+    channels and pixel layout as a render of the whole film.
+    """
+
+    def __init__(self, tiles, workers=None):
+        self.cols, self.rows = tiles
+        cpus = os.cpu_count() or 1
+        self.workers = workers or min(self.cols * self.rows, cpus)
+        # Tiles rendered at the same time share the cores
+        self.threads = max(1, cpus // self.workers)
+
+    def render(self, scene_file, variant, seed=0):
+        """
+        Render a Mitsuba scene file in tiles.
+
+        Tile `i` (in row-major order) is rendered with seed `seed + i`. The
+        tile scenes are written next to `scene_file`, so relative file
+        references still resolve, and removed afterwards.
+
+        Returns:
+            np.ndarray: The stitched image, of shape (height, width, channels).
+        """
+        root = ET.parse(scene_file).getroot()
+        width, height = film_size(root)
+        windows = tile_windows(width, height, self.cols, self.rows)
+        base = os.path.splitext(scene_file)[0]
+        tile_base = [f"{base}_tile{i}" for i in range(len(windows))]
+
+        def render_tile(i):
+            ET.ElementTree(crop_scene(root, windows[i])).write(f"{tile_base[i]}.xml")
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--variant",
+                    variant,
+                    "--seed",
+                    str(seed + i),
+                    "--threads",
+                    str(self.threads),
+                    f"{tile_base[i]}.xml",
+                    f"{tile_base[i]}.exr",
+                ],
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"Rendering tile {i} failed: {result.stderr}")
+            path = f"{tile_base[i]}.exr"
+            channels = exr_util.exr_channels(path)
+            return exr_util.read_exr(
+                path, exr_util.RGBA if "A" in channels else exr_util.RGB
+            )
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                tiles = list(executor.map(render_tile, range(len(windows))))
+        finally:
+            for path in tile_base:
+                for extension in (".xml", ".exr"):
+                    if os.path.exists(f"{path}{extension}"):
+                        os.remove(f"{path}{extension}")
+
+        image = np.zeros((height, width, tiles[0].shape[2]), dtype=np.float32)
+        for (x, y, w, h), tile in zip(windows, tiles):
+            image[y : y + h, x : x + w] = tile
+        return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render one tile of a Mitsuba scene.")
+    parser.add_argument("scene_file", help="Mitsuba scene with a cropped film")
+    parser.add_argument("output_file", help="EXR file to write")
+    parser.add_argument("--variant", default="scalar_rgb", help="Mitsuba variant")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the sampler")
+    parser.add_argument("--threads", type=int, help="number of render threads")
+    args = parser.parse_args()
+
+    mi.set_variant(args.variant)
+    if args.threads:
+        import drjit as dr
+
+        dr.set_thread_count(args.threads)
+    image = mi.render(mi.load_file(args.scene_file), seed=args.seed)
+    mi.util.write_bitmap(args.output_file, image, write_async=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,152 @@
-from validation_tools.nori_to_mitsuba import convert_scene
-from validation_tools.exr_util import read_exr, write_exr
-from PIL import Image, ImageDraw, ImageFont
-import mitsuba as mi
-import numpy as np
+from validation_tools.nori_to_mitsuba import save_xml, translate_root
+from validation_tools.scenegen import to_xml
+from validation_tools.sweep import Sweep
+from validation_tools.lazy import lazy_import
+from validation_tools.mitsuba_sweep import MitsubaSweepRenderer
+from validation_tools.mesh_cache import MeshCache
+from validation_tools.profiling import Profiler
+from validation_tools.render_server import DEFAULT_SOCKET_PATH, RenderClient
+from validation_tools.render_farm import RenderFarm
+from validation_tools.tiled_render import TiledRenderer
+from validation_tools.thumbnails import ThumbnailCache
+from validation_tools.regression import (
+    DEFAULT_REFERENCE_DIR,
+    DEFAULT_TIME_BUDGET,
+    DEFAULT_TOLERANCES,
+    ReferenceStore,
+)
+from validation_tools.render_cache import (
+    DEFAULT_CACHE_SIZE,
+    RenderCache,
+    file_digest,
+    scene_key,
+)
+import asyncio
+import csv
+import errno
+import json
 import os
+import shutil
 import subprocess
+import sys
+import threading
+import time
 import datetime
-import cv2
-from tqdm import tqdm
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+# Heavy dependencies are imported on first use, so suites that only write
+# scenes, or render Nori and Mitsuba in other processes, start quickly
+mi = lazy_import("mitsuba")
+np = lazy_import("numpy")
+cv2 = lazy_import("cv2")
+tqdm = lazy_import("tqdm")
+grid = lazy_import("validation_tools.grid")
+metrics = lazy_import("validation_tools.metrics")
+exr_util = lazy_import("validation_tools.exr_util")
+
+NORI_BUILD_DIR = "build"
+NORI_EXECUTABLE = f"./{NORI_BUILD_DIR}/nori"
+MITSUBA_VARIANT = "scalar_rgb"
+# Errors of `os.link` on file systems that cannot hard link the renders
+LINK_UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP)
 
 
 class ValidationSuite:
-    def __init__(self, name, nori_only=False):
+    def __init__(
+        self,
+        name,
+        nori_only=False,
+        use_cache=False,
+        cache_size=DEFAULT_CACHE_SIZE,
+        mitsuba_variant=MITSUBA_VARIANT,
+        reuse_mitsuba_scene=False,
+        nori_executable=NORI_EXECUTABLE,
+        cache_meshes=False,
+        render_server=DEFAULT_SOCKET_PATH,
+        farm=None,
+        mitsuba_tiles=None,
+        share_mitsuba_renders=True,
+        cache_thumbnails=False,
+    ):
+        """
+        Args:
+            name (str): Unique name of the suite, used as its directory name.
+            nori_only (bool): Only render with Nori, skip the Mitsuba
+                reference.
+            use_cache (bool): Restore unchanged renders from the persistent
+                render cache.
+            cache_size (int): Maximum size of the render cache in bytes.
+            mitsuba_variant (str): Mitsuba variant of the reference renders,
+                e.g. "llvm_ad_rgb".
+            reuse_mitsuba_scene (bool): Load the Mitsuba scene once and only
+                update the parameters that change between scenes (see
+                `MitsubaSweepRenderer`).
+            nori_executable (str): Path of the Nori executable.
+            cache_meshes (bool): Load OBJ meshes in Mitsuba from binary PLY
+                copies (see `MeshCache`).
+            render_server (str): Socket of a render server that renders the
+                Mitsuba scenes if it is running (see `render_server.py`). None
+                never uses one.
+            farm (list of str): Addresses ("host:port") of render farm workers
+                that render all scenes (see `render_farm.py`).
+            mitsuba_tiles (tuple of int): (cols, rows) of tiles that Mitsuba
+                renders are split into (see `TiledRenderer`).
+            share_mitsuba_renders (bool): Render identical Mitsuba scenes only
+                once and link their renders.
+            cache_thumbnails (bool): Build grid cells from cached downsampled
+                renders (see `ThumbnailCache`).
+        """
         self.name = name
         self.nori_only = nori_only
+        self.cache = RenderCache(max_size=cache_size) if use_cache else None
+        # Renderer -> fingerprint mixed into cache keys, set before rendering
+        self.__fingerprints = {}
+        self.mitsuba_variant = mitsuba_variant
+        self.sweep_renderer = MitsubaSweepRenderer() if reuse_mitsuba_scene else None
+        self.tiled_renderer = (
+            TiledRenderer(mitsuba_tiles)
+            if mitsuba_tiles and not reuse_mitsuba_scene
+            else None
+        )
+        self.nori_executable = nori_executable
+        self.mesh_cache = MeshCache() if cache_meshes and not nori_only else None
+        self.render_server = render_server
+        self.__server = None
+        self.farm = farm
+        self.__farm = None
+        # Worker address and console output of every render done on the farm
+        self.__farm_jobs = {}
+        self.share_mitsuba_renders = share_mitsuba_renders
+        # Mitsuba scene key -> (name of the scene rendering it, done event)
+        self.__mitsuba_references = {}
+        # Scene name -> its Mitsuba scene key, for scenes rendering a reference
+        self.__reference_keys = {}
+        # Scene name -> number of scenes linking its Mitsuba renders right now
+        self.__linking = {}
+        # Scenes whose Mitsuba renders are removed once nothing links them
+        self.__released = set()
+        self.__mitsuba_references_lock = threading.Lock()
 
         self.directory = f"validation/scenes/{name}"
         self.scene_directory = f"{self.directory}/scenes"
         self.render_directory = f"{self.directory}/renders"
         self.log_directory = f"{self.directory}/logs"
+        self.thumbnails = (
+            ThumbnailCache(f"{self.directory}/thumbnails") if cache_thumbnails else None
+        )
 
         self.scenes = []
         self.scene_labels = []
+        # Scenes registered so far, including those `render_stream` released
+        self.__scene_count = 0
+        # Wall time in seconds of the last render of each scene, per renderer
+        self.render_times = {}
+        self.profiler = Profiler()
 
         self.__setup_directories()
 
@@ -38,96 +163,864 @@ class ValidationSuite:
         scene_name = scene.name
         base_path = f"{self.scene_directory}/{scene_name}"
 
-        num_scenes = len(self.scenes)
+        num_scenes = self.__scene_count
+        self.__scene_count += 1
 
         nori_path = f"{base_path}_{num_scenes}_nori.xml"
         mitsuba_path = f"{base_path}_{num_scenes}_mitsuba.xml"
 
-        xml_str = scene.generate()
-        with open(nori_path, "w") as f:
-            f.write(xml_str)
-
-        if not self.nori_only:
-            convert_scene(nori_path, mitsuba_path, verbose=False)
-
         scene.name = f"{scene_name}_{num_scenes}"
+        self.__write_scene_files(scene, nori_path, mitsuba_path)
+
         self.scenes.append(scene)
         self.scene_labels.append(label)
 
         print(f"Generated scene {scene.name}")
 
-    def render(self):
-        iter = tqdm(self.scenes, desc="Rendering scenes") if len(self.scenes) > 1 else self.scenes
+    def __write_scene_files(self, scene, nori_path, mitsuba_path):
+        with self.profiler.phase("write_nori_xml", scene.name):
+            scene.write(nori_path)
+
+        if not self.nori_only:
+            # Only the sweep renderer needs ids to find the updated parameters
+            object_ids = None
+            if self.sweep_renderer is not None:
+                object_ids = [
+                    name
+                    for name, tag in scene.desc.items()
+                    if tag.tagname not in ("integrator", "sampler", "camera")
+                ]
+            # Converted in memory, the Nori XML is not parsed again
+            with self.profiler.phase("convert_scene", scene.name, "mitsuba"):
+                mitsuba_root = translate_root(to_xml(scene.desc), object_ids)
+                if self.mesh_cache is not None:
+                    self.mesh_cache.rewrite_scene(mitsuba_root, self.scene_directory)
+                save_xml(mitsuba_root, mitsuba_path)
+
+    def render(self, workers=1):
+        """
+        Render all registered scenes with Nori and (unless `nori_only`) Mitsuba.
+
+        Args:
+            workers (int): Maximum number of scenes rendered at the same time.
+                Each worker runs the Nori subprocess of a scene followed by its
+                Mitsuba render, so Nori and Mitsuba renders of different scenes
+                overlap. Scenes are always processed and reported in
+                registration order. With a render farm, as many scenes as there
+                are workers are rendered at the same time instead.
+        """
         if len(self.scenes) == 1:
             print(f"Rendering scene {self.scenes[0].name}")
-        for scene in iter:
 
+        self.__prepare_render()
+        if self.__farm is not None:
+            workers = self.__farm.size
+
+        progress = tqdm.tqdm(
+            total=len(self.scenes),
+            desc="Rendering scenes",
+            disable=len(self.scenes) <= 1,
+        )
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [
+                executor.submit(self.__render_scene, scene) for scene in self.scenes
+            ]
+            for future in as_completed(futures):
+                future.result()
+                progress.update()
+        progress.close()
+
+        print(f"Rendered scenes {[scene.name for scene in self.scenes]}")
+
+    def render_adaptive(
+        self,
+        start_spp=16,
+        max_spp=1024,
+        tolerance=5e-3,
+        uncertainty=0.25,
+        workers=1,
+    ):
+        """
+        Render all scenes with increasing sample counts until Nori and
+        Mitsuba clearly agree or clearly disagree.
+
+        Each scene is rendered at `start_spp`, then the sample count is
+        doubled after every batch. After each batch, the relMSE between the
+        Nori render and the running Mitsuba estimate is computed. It is the
+        sum of a bias term (the actual difference between the renderers)
+        and a noise term that shrinks proportionally to 1 / spp. The relMSE
+        of the last two batches gives an estimate of both terms, and the
+        bias estimate is trusted up to `uncertainty` times the noise term.
+        A scene stops as
+
+        - "converged" once the bias estimate plus its uncertainty is below
+          `tolerance`,
+        - "diverged" once the bias estimate minus its uncertainty is above
+          `tolerance`,
+        - "max_spp" if neither happened before reaching `max_spp`.
+
+        Mitsuba batches are rendered with different seeds and accumulated,
+        so the Mitsuba reference of a scene costs the final sample count.
+        Nori renders every sample count from scratch. The final renders are
+        written to the renders directory like `render()`, and the scene's
+        sample count is set to the final sample count. Render caching and
+        `reuse_mitsuba_scene` do not apply to adaptive renders, which are
+        always rendered locally.
+
+        Args:
+            start_spp (int): Samples per pixel of the first batch.
+            max_spp (int): Maximum samples per pixel of a scene.
+            tolerance (float): relMSE bias below which Nori and Mitsuba are
+                considered to agree.
+            uncertainty (float): Uncertainty of the bias estimate, as a
+                fraction of the noise term. Larger values are more conservative
+                and spend more samples.
+            workers (int): Maximum number of scenes rendered at the same time.
+
+        Returns:
+            list of dict: Status, final spp, samples spent per renderer, the
+                estimated bias and the relMSE after every batch of every scene,
+                in registration order. Also written to `metrics/adaptive.json`
+                in the suite directory.
+        """
+        if self.nori_only:
+            raise ValueError("Adaptive rendering requires Mitsuba references.")
+
+        self.__prepare_render(remote=False)
+
+        def render_scene(scene):
+            return self.__render_adaptive(
+                scene, start_spp, max_spp, tolerance, uncertainty
+            )
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(
+                tqdm.tqdm(
+                    executor.map(render_scene, self.scenes),
+                    total=len(self.scenes),
+                    desc="Rendering scenes adaptively",
+                    disable=len(self.scenes) <= 1,
+                )
+            )
+
+        metrics_directory = f"{self.directory}/metrics"
+        os.makedirs(metrics_directory, exist_ok=True)
+        with open(f"{metrics_directory}/adaptive.json", "w") as f:
+            json.dump(results, f, indent=4)
+
+        spent = sum(r["nori_samples"] + r["mitsuba_samples"] for r in results)
+        fixed = 2 * max_spp * len(results)
+        for result in results:
+            print(
+                f"{result['scene']}: {result['status']} at {result['spp']} spp "
+                f"(relMSE {result['relmse']:.2e}, bias {result['bias']:.2e})"
+            )
+        print(
+            f"Spent {spent} samples per pixel in total, "
+            f"{spent / fixed:.0%} of rendering every scene at {max_spp} spp"
+        )
+        return results
+
+    def __render_adaptive(self, scene, start_spp, max_spp, tolerance, uncertainty):
+        nori_name = f"{scene.name}_nori"
+        mitsuba_name = f"{scene.name}_mitsuba"
+        nori_path = f"{self.scene_directory}/{nori_name}.xml"
+        mitsuba_path = f"{self.scene_directory}/{mitsuba_name}.xml"
+
+        with self.profiler.phase("mitsuba_load", scene.name, "mitsuba"):
+            mitsuba_scene = mi.load_file(mitsuba_path)
+        estimate = None
+        spp = 0
+        history = []
+        nori_samples = 0
+        bias = float("nan")
+        status = "max_spp"
+
+        while spp < max_spp:
+            batch = spp if spp > 0 else min(start_spp, max_spp)
+            batch = min(batch, max_spp - spp)
+            with self.profiler.phase("mitsuba_render", scene.name, "mitsuba"):
+                image = np.array(
+                    mi.render(mitsuba_scene, spp=batch, seed=len(history)),
+                    dtype=np.float32,
+                )[:, :, :3]
+            if estimate is None:
+                estimate = image
+            else:
+                estimate = (estimate * spp + image * batch) / (spp + batch)
+            spp += batch
+
+            scene.set_spp(spp)
+            with self.profiler.phase("write_nori_xml", scene.name):
+                scene.write(nori_path)
             self.__render_nori(scene)
-            timestamp = datetime.datetime.now()
+            nori_samples += spp
 
-            with open(f"{self.log_directory}/{scene.name}_nori.log", "w") as log_file:
-                log_file.write(f"Scene name: {scene.name}\n")
-                log_file.write(f"Renderer: nori\n")
-                log_file.write(
-                    f"Integrator: {scene.desc['integrator'].kwargs['type']}\n"
+            with self.profiler.phase("compare", scene.name):
+                nori = exr_util.read_exr(f"{self.render_directory}/{nori_name}.exr")
+                relmse = float(np.mean(metrics.relative_error(nori, estimate)))
+            history.append({"spp": spp, "relmse": relmse})
+
+            if len(history) < 2:
+                continue
+
+            # relMSE = bias + noise / spp, solved for the last two batches. At
+            # low spp the noise can shrink faster than that (outliers), which
+            # would give a negative bias, so all of the relMSE counts as noise.
+            ratio = spp / history[-2]["spp"]
+            bias = (ratio * relmse - history[-2]["relmse"]) / (ratio - 1)
+            bias = min(max(bias, 0.0), relmse)
+            noise = relmse - bias
+            if bias + uncertainty * noise < tolerance:
+                status = "converged"
+                break
+            if bias - uncertainty * noise > tolerance:
+                status = "diverged"
+                break
+
+        self.__write_scene_files(scene, nori_path, mitsuba_path)
+        with self.profiler.phase("write_bitmap", scene.name, "mitsuba"):
+            exr_util.write_exr(f"{self.render_directory}/{mitsuba_name}.exr", estimate)
+            mi.util.write_bitmap(
+                f"{self.render_directory}/{mitsuba_name}.png",
+                estimate,
+                write_async=False,
+            )
+
+        timestamp = datetime.datetime.now()
+        for renderer in ["nori", "mitsuba"]:
+            self.__write_log(scene, renderer, timestamp)
+            with open(f"{self.log_directory}/{scene.name}_{renderer}.log", "a") as log:
+                log.write(
+                    f"Adaptive: {status} after {len(history)} batches, "
+                    f"relMSE {history[-1]['relmse']:.3e}, bias {bias:.3e}\n"
                 )
-                log_file.write(f"Sampler: {scene.desc['sampler'].kwargs['type']}\n")
-                log_file.write(
-                    f"Resolution: {scene.desc['camera'].children[2].kwargs['value']} x {scene.desc['camera'].children[3].kwargs['value']}\n"
+
+        return {
+            "scene": scene.name,
+            "status": status,
+            "spp": spp,
+            "nori_samples": nori_samples,
+            "mitsuba_samples": spp,
+            "relmse": history[-1]["relmse"],
+            "bias": bias,
+            "history": history,
+        }
+
+    def sweep(self, scene, apply=None, label=None, **axes):
+        """
+        Describe a parameter sweep over `scene` without generating any variant.
+
+        Args:
+            scene (Scene): The base scene. It is copied, later changes do not
+                affect the sweep.
+            apply (callable): Called as `apply(scene, **values)` with the
+                values of all axes except "integrator", "spp" and "quality" to
+                modify a variant.
+            label (str or callable): Grid label of a variant, either a format
+                string or a function called with the values of all axes.
+            **axes: Axis names and their values. Variants are the cartesian
+                product.
+
+        Returns:
+            Sweep: Call `run()` to stream the variants through registration,
+                rendering and grid placement (see `render_stream`).
+
+        Example:
+            >>> sweep = val.sweep(
+            ...     scene,
+            ...     apply=lambda scene, color, alpha: scene.set_bsdf(
+            ...         "material_preview", make_material("microfacet", kd=color, alpha=alpha)
+            ...     ),
+            ...     label="alpha: {alpha:.3f}",
+            ...     color=color_range((0.01, 0.1, 0.3), (0.5, 0, 0.05), n=5),
+            ...     alpha=[0.001, 0.1, 0.25, 0.5, 1],
+            ... )
+            >>> sweep.run(workers=4, grid_name="color_roughness_grid", cols=5)
+        """
+        return Sweep(self, scene, apply=apply, label=label, **axes)
+
+    def render_stream(
+        self,
+        variants,
+        count,
+        workers=1,
+        grid_name="grid",
+        rows=None,
+        cols=None,
+        cell_resolution=128,
+        generate_labels=False,
+        keep_files=True,
+    ):
+        """
+        Register, render and grid scenes while they are being generated.
+
+        Each (scene, label) pair of `variants` is registered and rendered as
+        soon as a worker is free, and its renders are placed in the grid as
+        soon as they complete. At most `2 * workers` scenes are generated
+        ahead of the grid.
+
+        Args:
+            variants (iterable): (scene, label) pairs, e.g. a `Sweep`. Consumed
+                lazily.
+            count (int): Number of variants, used to lay out the grid.
+            workers (int): Maximum number of scenes rendered at the same time.
+                With a render farm, the number of workers instead.
+            grid_name, rows, cols, cell_resolution, generate_labels: Grid
+                settings, see `make_grid`.
+            keep_files (bool): If False, the scene XMLs and renders of a
+                variant are deleted once it has been placed in the grid, and
+                its scene is not kept in `scenes`, so disk and memory use stay
+                bounded. Logs and grids are always kept. Per variant, only its
+                render times and timing records remain in memory.
+        """
+        size = grid.grid_size(count, rows, cols)
+        # Pyramids of renders that are deleted right away would only use disk
+        canvas = grid.GridCanvas(
+            size,
+            cell_resolution,
+            self.nori_only,
+            thumbnails=self.thumbnails if keep_files else None,
+        )
+        labels = []
+        names = []
+        submitted = 0
+
+        self.__prepare_render()
+        if self.__farm is not None:
+            workers = self.__farm.size
+
+        progress = tqdm.tqdm(total=count, desc="Rendering scenes", disable=count <= 1)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for scene, label in variants:
+                self.register_scene(scene, label)
+                scene = self.scenes[-1]
+                if keep_files:
+                    names.append(scene.name)
+                else:
+                    # Released once its cells are placed
+                    self.scenes.pop()
+                    self.scene_labels.pop()
+                if generate_labels:
+                    labels.append(label)
+                future = executor.submit(self.__render_scene, scene)
+                pending[future] = (submitted, scene)
+                submitted += 1
+
+                if len(pending) >= 2 * max(1, workers):
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self.__place_cells(done, pending, canvas, keep_files)
+                    progress.update(len(done))
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                self.__place_cells(done, pending, canvas, keep_files)
+                progress.update(len(done))
+        progress.close()
+
+        with self.profiler.phase("grid_save"):
+            canvas.save(self.render_directory, grid_name)
+        if generate_labels:
+            with self.profiler.phase("grid_labels"):
+                canvas.save_labeled(self.render_directory, grid_name, labels)
+
+        if keep_files:
+            print(f"Rendered scenes {names}")
+        else:
+            print(f"Rendered {submitted} scenes")
+
+    def __place_cells(self, done, pending, canvas, keep_files):
+        for future in done:
+            index, scene = pending.pop(future)
+            future.result()
+            with self.profiler.phase("grid_place", scene.name):
+                canvas.place(index, self.render_directory, scene.name)
+
+            if not keep_files:
+                for renderer in canvas.renderers:
+                    os.remove(f"{self.scene_directory}/{scene.name}_{renderer}.xml")
+                    if renderer == "mitsuba":
+                        self.__release_reference(scene.name)
+                    else:
+                        self.__remove_renders(f"{scene.name}_{renderer}")
+
+    def __release_reference(self, scene_name):
+        """
+        Remove the Mitsuba renders of a scene, or let the last scene linking
+        them remove them (see `share_mitsuba_renders`).
+        """
+        with self.__mitsuba_references_lock:
+            key = self.__reference_keys.pop(scene_name, None)
+            if key is not None:
+                # Later identical scenes render the reference again
+                del self.__mitsuba_references[key]
+            if self.__linking.get(scene_name):
+                self.__released.add(scene_name)
+            else:
+                self.__remove_renders(f"{scene_name}_mitsuba")
+
+    def __remove_renders(self, name):
+        os.remove(f"{self.render_directory}/{name}.png")
+        os.remove(f"{self.render_directory}/{name}.exr")
+
+    def render_pipelined(
+        self,
+        workers=1,
+        grid_name="grid",
+        rows=None,
+        cols=None,
+        cell_resolution=128,
+        generate_labels=False,
+        compare=True,
+        heatmaps=True,
+        queue_size=None,
+    ):
+        """
+        Render, compare and grid all registered scenes in one pipeline.
+
+        The work runs as concurrent asyncio stages connected by bounded
+        queues, so renders never wait for the I/O of earlier scenes:
+
+        - `workers` Nori stages, which run Nori with asyncio subprocesses,
+        - a Mitsuba stage, which renders the reference of every scene as
+          soon as its Nori render is done, in a worker thread,
+        - a post-processing stage, which writes the logs, computes the
+          metrics (see `compare`) and places the renders in the grid (see
+          `make_grid`) while the next scenes render.
+
+        Produces the same renders, logs, metrics and grids as `render`,
+        `compare` and `make_grid`.
+
+        Args:
+            workers (int): Number of Nori renders running at the same time.
+                With a render farm, the number of workers instead.
+            grid_name, rows, cols, cell_resolution, generate_labels: Grid
+                settings, see `make_grid`.
+            compare (bool): Compute the metrics of every scene. Ignored with
+                `nori_only`.
+            heatmaps (bool): Write error heatmaps, see `compare`.
+            queue_size (int): Capacity of the queues between stages,
+                `2 * workers` by default. A full queue pauses the stages that
+                feed it.
+
+        Returns:
+            list of dict: Metrics of every scene, in registration order, or
+                None if `compare` is False.
+        """
+        if len(self.scenes) == 1:
+            print(f"Rendering scene {self.scenes[0].name}")
+        compare = compare and not self.nori_only
+        if compare:
+            os.makedirs(f"{self.directory}/metrics", exist_ok=True)
+        canvas = grid.GridCanvas(
+            grid.grid_size(len(self.scenes), rows, cols),
+            cell_resolution,
+            self.nori_only,
+            thumbnails=self.thumbnails,
+        )
+
+        self.__prepare_render()
+        if self.__farm is not None:
+            workers = self.__farm.size
+        workers = max(1, workers)
+        queue_size = queue_size or 2 * workers
+        try:
+            results = asyncio.run(
+                self.__run_pipeline(canvas, workers, queue_size, compare, heatmaps)
+            )
+        except ExceptionGroup as group:
+            # Raise the error of the stage that failed like `render` would
+            raise group.exceptions[0]
+
+        with self.profiler.phase("grid_save"):
+            canvas.save(self.render_directory, grid_name)
+        if generate_labels:
+            with self.profiler.phase("grid_labels"):
+                canvas.save_labeled(self.render_directory, grid_name, self.scene_labels)
+        print(f"Rendered scenes {[scene.name for scene in self.scenes]}")
+
+        if not compare:
+            return None
+        self.__write_metrics_summary(results)
+        return results
+
+    async def __run_pipeline(self, canvas, workers, queue_size, compare, heatmaps):
+        nori_queue = asyncio.Queue(maxsize=queue_size)
+        mitsuba_queue = asyncio.Queue(maxsize=queue_size)
+        post_queue = asyncio.Queue(maxsize=queue_size)
+        # The queue that follows the Nori stages
+        next_queue = post_queue if self.nori_only else mitsuba_queue
+
+        async def feed():
+            for index in range(len(self.scenes)):
+                await nori_queue.put(index)
+            for _ in range(workers):
+                await nori_queue.put(None)
+
+        async def nori_stage():
+            while (index := await nori_queue.get()) is not None:
+                entry = await self.__render_nori_async(self.scenes[index])
+                # Log entries travel with the scene, the post stage writes them
+                await next_queue.put((index, [entry]))
+
+        async def render_stages():
+            await asyncio.gather(feed(), *(nori_stage() for _ in range(workers)))
+            await next_queue.put(None)
+
+        async def mitsuba_stage():
+            while (item := await mitsuba_queue.get()) is not None:
+                index, entries = item
+                entry = await asyncio.to_thread(
+                    self.__render_reference, self.scenes[index]
                 )
-                log_file.write(
-                    f"SPP: {scene.desc['sampler'].children[0].kwargs['value']}\n"
+                await post_queue.put((index, entries + [entry]))
+            await post_queue.put(None)
+
+        async def post_stage():
+            results = [None] * len(self.scenes)
+            progress = tqdm.tqdm(
+                total=len(self.scenes),
+                desc="Rendering scenes",
+                disable=len(self.scenes) <= 1,
+            )
+            while (item := await post_queue.get()) is not None:
+                index, entries = item
+                results[index] = await asyncio.to_thread(
+                    self.__post_process, canvas, index, entries, compare, heatmaps
+                )
+                progress.update()
+            progress.close()
+            return results
+
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(render_stages())
+            if not self.nori_only:
+                tasks.create_task(mitsuba_stage())
+            post = tasks.create_task(post_stage())
+        return post.result()
+
+    async def __render_nori_async(self, scene):
+        """Render the Nori image of a scene in a subprocess, returns its log entry."""
+        if self.__farm is not None:
+            return await asyncio.to_thread(self.__render_output, scene, "nori")
+
+        entry, key = await asyncio.to_thread(self.__restore_output, scene, "nori")
+        if entry is not None:
+            return entry
+
+        name = f"{scene.name}_nori"
+        start = time.perf_counter()
+        with self.profiler.phase("nori", scene.name, "nori"):
+            process = await asyncio.create_subprocess_exec(
+                self.nori_executable,
+                "-b",
+                f"{self.scene_directory}/{name}.xml",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await process.communicate()
+        if not process.returncode == 0:
+            print(f"Error rendering: {stderr.decode()}")
+        self.__move_nori_renders(name)
+        render_time = time.perf_counter() - start
+
+        return await asyncio.to_thread(
+            self.__store_output, scene, "nori", render_time, key
+        )
+
+    def __post_process(self, canvas, index, entries, compare, heatmaps):
+        scene = self.scenes[index]
+        for renderer, entry in zip(canvas.renderers, entries):
+            self.__write_log(scene, renderer, **entry)
+        with self.profiler.phase("grid_place", scene.name):
+            canvas.place(index, self.render_directory, scene.name)
+        if compare:
+            return self.__compare_scene(scene, heatmaps, chunk_rows=256)
+        return None
+
+    def __prepare_render(self, remote=True):
+        self.__server = None
+        self.__farm_jobs = {}
+        self.__mitsuba_references = {}
+        self.__reference_keys = {}
+        if remote and self.farm:
+            if self.__farm is None:
+                self.__farm = RenderFarm(self.farm)
+            else:
+                # Reconnects workers lost during a previous render
+                self.__farm.connect()
+            print(f"Rendering on {self.__farm.size} render farm workers")
+            if self.cache is not None:
+                self.__fingerprints = {
+                    "nori": self.__farm.fingerprint("nori"),
+                    "mitsuba": (
+                        f"{self.__farm.fingerprint('mitsuba')} {self.mitsuba_variant}"
+                    ),
+                }
+            return
+
+        farm = self.__farm
+        self.__farm = None
+        if farm is not None:
+            farm.close()
+
+        mitsuba_version = None
+        if (
+            remote
+            and not self.nori_only
+            and self.render_server is not None
+            and self.sweep_renderer is None
+            and self.tiled_renderer is None
+        ):
+            client = RenderClient(self.render_server)
+            status = client.ping()
+            if status is not None:
+                self.__server = client
+                mitsuba_version = status["version"]
+                print(f"Rendering Mitsuba scenes on the server at {self.render_server}")
+
+        if not self.nori_only and self.__server is None:
+            mi.set_variant(self.mitsuba_variant)
+            mitsuba_version = mi.__version__
+
+        if self.cache is not None:
+            self.__fingerprints = {"nori": self.__nori_fingerprint()}
+            if not self.nori_only:
+                self.__fingerprints["mitsuba"] = (
+                    f"mitsuba {mitsuba_version} {self.mitsuba_variant}"
+                )
+
+    def __render_scene(self, scene):
+        self.__write_log(scene, "nori", **self.__render_output(scene, "nori"))
+        if not self.nori_only:
+            self.__write_log(scene, "mitsuba", **self.__render_reference(scene))
+
+    def __render_output(self, scene, renderer):
+        """Render or restore the images of a scene, returns its log entry."""
+        entry, key = self.__restore_output(scene, renderer)
+        if entry is not None:
+            return entry
+        return self.__store_output(scene, renderer, self.__render(scene, renderer), key)
+
+    def __outputs(self, scene, renderer):
+        name = f"{scene.name}_{renderer}"
+        return [
+            f"{self.render_directory}/{name}.png",
+            f"{self.render_directory}/{name}.exr",
+        ]
+
+    def __restore_output(self, scene, renderer):
+        """
+        Remove old renders of a scene and restore them from the render cache.
+
+        Returns the log entry of the restored render (None if it has to be
+        rendered) and the cache key of the scene.
+        """
+        outputs = self.__outputs(scene, renderer)
+        # Renders may be hard links shared with other scenes, which must not
+        # be overwritten in place
+        for path in outputs:
+            if os.path.exists(path):
+                os.remove(path)
+        if self.cache is None:
+            return None, None
+
+        with self.profiler.phase("cache_lookup", scene.name, renderer):
+            key = scene_key(
+                f"{self.scene_directory}/{scene.name}_{renderer}.xml",
+                self.__fingerprints[renderer],
+            )
+            metadata = self.cache.get(key, outputs)
+        if metadata is None:
+            return None, key
+
+        render_time = metadata.get("render_time")
+        self.render_times.setdefault(scene.name, {})[renderer] = render_time
+        entry = {
+            "timestamp": metadata["rendered_at"],
+            "render_time": render_time,
+            "cache_key": key,
+        }
+        return entry, key
+
+    def __store_output(self, scene, renderer, render_time, key):
+        """Record a finished render and add it to the cache, returns its log entry."""
+        self.render_times.setdefault(scene.name, {})[renderer] = render_time
+        timestamp = datetime.datetime.now()
+        if key is not None:
+            with self.profiler.phase("cache_store", scene.name, renderer):
+                self.cache.put(
+                    key,
+                    self.__outputs(scene, renderer),
+                    rendered_at=str(timestamp),
+                    render_time=render_time,
                 )
+        return {"timestamp": timestamp, "render_time": render_time}
+
+    def __render_reference(self, scene):
+        """
+        Render the Mitsuba reference of a scene, unless an identical scene
+        renders it (see `share_mitsuba_renders`). Returns its log entry.
+        """
+        if not self.share_mitsuba_renders:
+            return self.__render_output(scene, "mitsuba")
+
+        name = f"{scene.name}_mitsuba"
+        # Covers the Mitsuba XML and the files it references, not its name
+        key = scene_key(f"{self.scene_directory}/{name}.xml", self.mitsuba_variant)
+        with self.__mitsuba_references_lock:
+            source = self.__mitsuba_references.get(key)
+            if source is None:
+                done = threading.Event()
+                self.__mitsuba_references[key] = (scene.name, done)
+                self.__reference_keys[scene.name] = key
+            else:
+                # Keeps `render_stream` from removing the renders while linking
+                source_name, done = source
+                self.__linking[source_name] = self.__linking.get(source_name, 0) + 1
+
+        if source is None:
+            try:
+                return self.__render_output(scene, "mitsuba")
+            finally:
+                done.set()
+
+        try:
+            done.wait()
+            with self.profiler.phase("share_render", scene.name, "mitsuba"):
+                shared = self.__link_renders(f"{source_name}_mitsuba", name)
+        finally:
+            with self.__mitsuba_references_lock:
+                self.__linking[source_name] -= 1
+                if not self.__linking[source_name]:
+                    del self.__linking[source_name]
+                    if source_name in self.__released:
+                        self.__released.remove(source_name)
+                        self.__remove_renders(f"{source_name}_mitsuba")
+        if not shared:
+            # The source failed
+            return self.__render_output(scene, "mitsuba")
+        self.render_times.setdefault(scene.name, {})["mitsuba"] = None
+        return {"timestamp": datetime.datetime.now(), "shared_with": source_name}
+
+    def __link_renders(self, source, target):
+        """Hard link (or copy) the renders of a scene, False if they are missing."""
+        for extension in ("png", "exr"):
+            source_path = f"{self.render_directory}/{source}.{extension}"
+            target_path = f"{self.render_directory}/{target}.{extension}"
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            try:
+                os.link(source_path, target_path)
+            except FileNotFoundError:
+                # The source failed
+                return False
+            except OSError as e:
+                if e.errno not in LINK_UNSUPPORTED:
+                    raise
+                shutil.copyfile(source_path, target_path)
+        return True
+
+    def __render(self, scene, renderer):
+        """Render a scene and return the wall time of the render in seconds."""
+        start = time.perf_counter()
+        if self.__farm is not None:
+            self.__render_farm(scene, renderer)
+        elif renderer == "nori":
+            self.__render_nori(scene)
+        else:
+            self.__render_mitsuba(scene)
+        return time.perf_counter() - start
+
+    def __nori_fingerprint(self):
+        if not os.path.exists(self.nori_executable):
+            return "nori missing"
+        return f"nori {file_digest(self.nori_executable)}"
+
+    def __write_log(
+        self,
+        scene,
+        renderer,
+        timestamp,
+        render_time=None,
+        cache_key=None,
+        shared_with=None,
+    ):
+        integrator = scene.desc["integrator"].kwargs["type"]
+        if renderer == "mitsuba":
+            integrator = f"Mitsuba equivalent of {integrator}"
+
+        with self.profiler.phase("write_log", scene.name, renderer), open(
+            f"{self.log_directory}/{scene.name}_{renderer}.log", "w"
+        ) as log_file:
+            log_file.write(f"Scene name: {scene.name}\n")
+            log_file.write(f"Renderer: {renderer}\n")
+            log_file.write(f"Integrator: {integrator}\n")
+            log_file.write(f"Sampler: {scene.desc['sampler'].kwargs['type']}\n")
+            log_file.write(
+                f"Resolution: {scene.desc['camera'].children[2].kwargs['value']} x {scene.desc['camera'].children[3].kwargs['value']}\n"
+            )
+            log_file.write(
+                f"SPP: {scene.desc['sampler'].children[0].kwargs['value']}\n"
+            )
+            log_file.write(
+                f"Renders: {scene.name}_{renderer}.png, {scene.name}_{renderer}.exr\n"
+            )
+
+            if shared_with is not None:
                 log_file.write(
-                    f"Renders: {scene.name}_nori.png, {scene.name}_nori.exr\n"
+                    f"Identical to the Mitsuba scene of {shared_with}, renders "
+                    f"linked from {shared_with}_{renderer} at {timestamp}\n"
                 )
+                return
 
-                log_file.write(f"Rendered at {timestamp}\n")
-
-                if not self.nori_only:
-                    self.__render_mitsuba(scene)
-                    timestamp = datetime.datetime.now()
-
-                    with open(
-                        f"{self.log_directory}/{scene.name}_mitsuba.log", "w"
-                    ) as log_file:
-                        log_file.write(f"Scene name: {scene.name}\n")
-                        log_file.write(f"Renderer: mitsuba\n")
-                        log_file.write(
-                            f"Integrator: Mitsuba equivalent of {scene.desc['integrator'].kwargs['type']}\n"
-                        )
-                        log_file.write(
-                            f"Sampler: {scene.desc['sampler'].kwargs['type']}\n"
-                        )
-                        log_file.write(
-                            f"Resolution: {scene.desc['camera'].children[2].kwargs['value']} x {scene.desc['camera'].children[3].kwargs['value']}\n"
-                        )
-                        log_file.write(
-                            f"SPP: {scene.desc['sampler'].children[0].kwargs['value']}\n"
-                        )
-                        log_file.write(
-                            f"Renders: {scene.name}_mitsuba.png, {scene.name}_mitsuba.exr\n"
-                        )
-
-                        log_file.write(f"Rendered at {timestamp}\n")
+            log_file.write(f"Rendered at {timestamp}\n")
+            if render_time is not None:
+                log_file.write(f"Render time: {render_time:.3f} s\n")
+            if cache_key is not None:
+                log_file.write(f"Restored from render cache entry {cache_key}\n")
+                return
+            # Only needed for the log, so streamed sweeps do not accumulate them
+            farm_job = self.__farm_jobs.pop(f"{scene.name}_{renderer}", None)
+            if farm_job is not None:
+                log_file.write(f"Rendered on farm worker {farm_job['worker']}\n")
+                log_file.write(f"Worker render time: {farm_job['render_time']:.3f} s\n")
+                if farm_job["log"]:
+                    log_file.write(f"Worker output:\n{farm_job['log']}")
 
-        print(f"Rendered scenes {[scene.name for scene in self.scenes]}")
+    def __render_farm(self, scene, renderer):
+        name = f"{scene.name}_{renderer}"
+        output_path = f"{self.render_directory}/{name}"
+        with self.profiler.phase("farm_render", scene.name, renderer):
+            worker, result = self.__farm.render(
+                f"{self.scene_directory}/{name}.xml",
+                {".png": f"{output_path}.png", ".exr": f"{output_path}.exr"},
+                renderer,
+                self.mitsuba_variant,
+            )
+        self.__farm_jobs[name] = {
+            "worker": worker,
+            "render_time": result["render_time"],
+            "log": result["log"],
+        }
 
     def __render_nori(self, scene):
-        NORI_BUILD_DIR = "build"
-
         name = f"{scene.name}_nori"
 
-        result = subprocess.run(
-            [f"./{NORI_BUILD_DIR}/nori", "-b", f"{self.scene_directory}/{name}.xml"],
-            capture_output=True,
-            text=True,
-        )
+        with self.profiler.phase("nori", scene.name, "nori"):
+            result = subprocess.run(
+                [self.nori_executable, "-b", f"{self.scene_directory}/{name}.xml"],
+                capture_output=True,
+                text=True,
+            )
 
         if not result.returncode == 0:
             print(f"Error rendering: {result.stderr}")
 
-        # Move files to outputs
+        self.__move_nori_renders(name)
+
+    def __move_nori_renders(self, name):
         os.rename(
             f"{self.scene_directory}/{name}.png", f"{self.render_directory}/{name}.png"
         )
@@ -136,14 +1029,34 @@ class ValidationSuite:
         )
 
     def __render_mitsuba(self, scene):
-        mi.set_variant("scalar_rgb")
         name = f"{scene.name}_mitsuba"
-        scene = mi.load_file(f"{self.scene_directory}/{name}.xml")
-        image = mi.render(scene)
-
+        scene_file = f"{self.scene_directory}/{name}.xml"
         output_path = f"{self.render_directory}/{name}"
-        mi.util.write_bitmap(f"{output_path}.png", image)
-        mi.util.write_bitmap(f"{output_path}.exr", image)
+        if self.__server is not None:
+            with self.profiler.phase("mitsuba_server_render", scene.name, "mitsuba"):
+                self.__server.render(
+                    scene_file,
+                    [f"{output_path}.png", f"{output_path}.exr"],
+                    self.mitsuba_variant,
+                )
+            return
+
+        if self.sweep_renderer is not None:
+            # Loads or updates the scene, then renders it
+            with self.profiler.phase("mitsuba_sweep_render", scene.name, "mitsuba"):
+                image = self.sweep_renderer.render(scene_file)
+        elif self.tiled_renderer is not None:
+            with self.profiler.phase("mitsuba_tiled_render", scene.name, "mitsuba"):
+                image = self.tiled_renderer.render(scene_file, self.mitsuba_variant)
+        else:
+            with self.profiler.phase("mitsuba_load", scene.name, "mitsuba"):
+                mitsuba_scene = mi.load_file(scene_file)
+            with self.profiler.phase("mitsuba_render", scene.name, "mitsuba"):
+                image = mi.render(mitsuba_scene)
+
+        with self.profiler.phase("write_bitmap", scene.name, "mitsuba"):
+            mi.util.write_bitmap(f"{output_path}.png", image, write_async=False)
+            mi.util.write_bitmap(f"{output_path}.exr", image, write_async=False)
 
     def make_grid(
         self,
@@ -152,92 +1065,265 @@ class ValidationSuite:
         cols=None,
         cell_resolution=128,
         generate_labels=False,
+        streaming=False,
+        workers=1,
     ):
-        if rows is None and cols is None:
-            cols = len(self.scenes)
-            rows = 1
-        elif rows is None:
-            rows = (len(self.scenes) + cols - 1) // cols
-        elif cols is None:
-            cols = (len(self.scenes) + rows - 1) // rows
-
-        self.__make_png_grid(name, (cols, rows), cell_resolution, generate_labels)
-        self.__make_exr_grid(name, (cols, rows), cell_resolution)
-
-    def __make_png_grid(self, name, size, resolution, generate_labels):
-        nori_grid = Image.new("RGB", (size[0] * resolution, size[1] * resolution))
-        mitsuba_grid = Image.new("RGB", (size[0] * resolution, size[1] * resolution))
-
-        for i, scene in enumerate(self.scenes):
-            img = Image.open(f"{self.render_directory}/{scene.name}_nori.png")
-            img = img.resize((resolution, resolution))
-            nori_grid.paste(img, (i % size[0] * resolution, i // size[0] * resolution))
+        """
+        Arrange the renders of all scenes in PNG and EXR grids.
 
-            if not self.nori_only:
-                img = Image.open(f"{self.render_directory}/{scene.name}_mitsuba.png")
-                img = img.resize((resolution, resolution))
-                mitsuba_grid.paste(
-                    img, (i % size[0] * resolution, i // size[0] * resolution)
-                )
+        If neither `rows` nor `cols` is given, the renders are arranged in a
+        single row. With `streaming=True`, the EXR grids are written one row
+        of cells at a time instead of being assembled in memory, so their
+        peak memory use does not grow with the number of rows. The 8-bit PNG
+        grids are still assembled in memory. Renders are decoded and resized
+        by `workers` threads, which only pays off on machines with several
+        cores and for renders without cached thumbnails
+        (`benchmarks/bench_grid.py` measures it).
+        """
+        size = grid.grid_size(len(self.scenes), rows, cols)
+        scene_names = [scene.name for scene in self.scenes]
+        canvas = grid.GridCanvas(
+            size,
+            cell_resolution,
+            self.nori_only,
+            exr=not streaming,
+            thumbnails=self.thumbnails,
+        )
 
-        nori_grid.save(f"{self.render_directory}/{name}_nori.png")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            with self.profiler.phase("grid_fill"):
+                canvas.fill(self.render_directory, scene_names, executor)
+            with self.profiler.phase("grid_save"):
+                canvas.save(self.render_directory, name)
+            if streaming:
+                with self.profiler.phase("grid_exr_bands"):
+                    grid.write_exr_grids_in_bands(
+                        self.render_directory,
+                        name,
+                        scene_names,
+                        size,
+                        cell_resolution,
+                        canvas.renderers,
+                        executor,
+                        self.thumbnails,
+                    )
+        if generate_labels:
+            with self.profiler.phase("grid_labels"):
+                canvas.save_labeled(self.render_directory, name, self.scene_labels)
 
-        if not self.nori_only:
-            mitsuba_grid.save(f"{self.render_directory}/{name}_mitsuba.png")
+    def compare(self, heatmaps=True, chunk_rows=256, workers=1):
+        """
+        Compare the Nori render of every scene to its Mitsuba reference.
 
-        if generate_labels:
-            resolution = 256
-            nori_grid = nori_grid.resize((resolution, resolution))
-            draw = ImageDraw.Draw(nori_grid)
-            font = ImageFont.load_default(size=24)
-            for i, scene in enumerate(self.scene_labels):
-                label = self.scene_labels[i]
-                bbox = draw.textbbox((0, 0), label, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                position = (
-                    (i % size[0] + 0.5) * resolution - text_width // 2,
-                    (i // size[0] + 0.5) * resolution - text_height // 2,
-                )
-                draw.text(
-                    position,
-                    label,
-                    fill="white",
-                    align="center",
-                    font=font,
-                    stroke_fill="black",
-                    stroke_width=3,
+        Computes MSE, relMSE, SMAPE, SSIM and a perceptual color difference
+        (see `metrics.compare_images`) from the EXR renders. Renders are
+        read in bands of `chunk_rows` scanlines, so memory use does not
+        depend on the image size.
+
+        Results are written to `metrics/summary.json` and `metrics/summary.csv`
+        in the suite directory, and false-color heatmaps of the relative
+        error to `metrics/<scene>_error.png`.
+
+        Returns:
+            list of dict: Metrics of every scene, in registration order.
+        """
+        if self.nori_only:
+            raise ValueError("Comparing renders requires Mitsuba references.")
+
+        metrics_directory = f"{self.directory}/metrics"
+        os.makedirs(metrics_directory, exist_ok=True)
+
+        def compare_scene(scene):
+            return self.__compare_scene(scene, heatmaps, chunk_rows)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(
+                tqdm.tqdm(
+                    executor.map(compare_scene, self.scenes),
+                    total=len(self.scenes),
+                    desc="Comparing renders",
+                    disable=len(self.scenes) <= 1,
                 )
-            nori_grid.save(f"{self.render_directory}/{name}_nori_labeled.png")
+            )
 
-    def __make_exr_grid(self, name, size, resolution):
-        nori_grid = np.zeros(
-            (size[1] * resolution, size[0] * resolution, 3), dtype=np.float32
-        )
-        mitsuba_grid = np.zeros(
-            (size[1] * resolution, size[0] * resolution, 3), dtype=np.float32
-        )
+        self.__write_metrics_summary(results)
+        return results
 
-        for i, scene in enumerate(self.scenes):
-            img = read_exr(f"{self.render_directory}/{scene.name}_nori.exr")
-            img = cv2.resize(
-                img, (resolution, resolution), interpolation=cv2.INTER_CUBIC
+    def __compare_scene(self, scene, heatmaps, chunk_rows):
+        metrics_directory = f"{self.directory}/metrics"
+        with self.profiler.phase("compare", scene.name):
+            result = metrics.compare_exr_files(
+                f"{self.render_directory}/{scene.name}_nori.exr",
+                f"{self.render_directory}/{scene.name}_mitsuba.exr",
+                chunk_rows=chunk_rows,
+                heatmap=heatmaps,
             )
-            nori_grid[
-                (i // size[0]) * resolution : (i // size[0] + 1) * resolution,
-                (i % size[0]) * resolution : (i % size[0] + 1) * resolution,
-            ] = img
+        if heatmaps:
+            with self.profiler.phase("write_heatmap", scene.name):
+                cv2.imwrite(
+                    f"{metrics_directory}/{scene.name}_error.png",
+                    result.pop("heatmap"),
+                )
+        return {"scene": scene.name, **result}
 
-            if not self.nori_only:
-                img = read_exr(f"{self.render_directory}/{scene.name}_mitsuba.exr")
-                img = cv2.resize(
-                    img, (resolution, resolution), interpolation=cv2.INTER_CUBIC
+    def __write_metrics_summary(self, results):
+        metrics_directory = f"{self.directory}/metrics"
+        with open(f"{metrics_directory}/summary.json", "w") as f:
+            json.dump(results, f, indent=4)
+        with open(f"{metrics_directory}/summary.csv", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["scene"] + metrics.METRICS)
+            writer.writeheader()
+            writer.writerows(results)
+
+        print(f"Compared scenes, summary written to {metrics_directory}")
+
+    def bless(self, scenes=None, reference_directory=DEFAULT_REFERENCE_DIR):
+        """
+        Store the current Nori renders as the golden references of the suite.
+
+        The render time of each reference is taken from this run or, for
+        scenes rendered by another process, from its render log. Scenes
+        without a recorded render time cannot be blessed, since their time
+        budget could not be checked.
+
+        Args:
+            scenes (list of str): Names of the scenes to bless. All scenes by
+                default.
+            reference_directory (str): References are stored in
+                `<reference_directory>/<suite name>`, together with the render
+                times of the blessed renders.
+        """
+        store = ReferenceStore(f"{reference_directory}/{self.name}")
+        names = [scene.name for scene in self.scenes]
+        for name in names if scenes is None else scenes:
+            if name not in names:
+                raise ValueError(f"Scene {name} is not registered.")
+            render_time = self.__render_time(name, "nori")
+            if render_time is None:
+                raise ValueError(
+                    f"No render time recorded for scene {name}, render it "
+                    "before blessing it."
                 )
-                mitsuba_grid[
-                    (i // size[0]) * resolution : (i // size[0] + 1) * resolution,
-                    (i % size[0]) * resolution : (i % size[0] + 1) * resolution,
-                ] = img
+            store.bless(name, f"{self.render_directory}/{name}_nori.exr", render_time)
+        store.save()
 
-        write_exr(f"{self.render_directory}/{name}_nori.exr", nori_grid)
-        if not self.nori_only:
-            write_exr(f"{self.render_directory}/{name}_mitsuba.exr", mitsuba_grid)
+        print(f"Blessed references in {store.directory}")
+
+    def __render_time(self, scene_name, renderer):
+        """
+        Wall time of the last render of a scene in seconds, from this run or
+        from its render log. None if neither recorded one.
+        """
+        render_time = self.render_times.get(scene_name, {}).get(renderer)
+        if render_time is not None:
+            return render_time
+        log_path = f"{self.log_directory}/{scene_name}_{renderer}.log"
+        if not os.path.exists(log_path):
+            return None
+        with open(log_path) as f:
+            for line in f:
+                if line.startswith("Render time: "):
+                    return float(line.split()[2])
+        return None
+
+    def check_references(
+        self,
+        tolerances=None,
+        scene_tolerances=None,
+        time_budget=DEFAULT_TIME_BUDGET,
+        scene_time_budgets=None,
+        reference_directory=DEFAULT_REFERENCE_DIR,
+        exit_on_failure=True,
+    ):
+        """
+        Compare the Nori render of every scene to its blessed reference.
+
+        A scene fails if a metric is out of tolerance, if its render took
+        longer than its time budget, or if it has no reference. The report
+        is printed and written to `regression/report.json` in the suite
+        directory.
+
+        Args:
+            tolerances (dict): Metric bounds of all scenes, e.g.
+                {"relmse": 1e-2, "ssim": 0.95}. SSIM is a lower bound, all
+                other metrics are upper bounds. Defaults to
+                `regression.DEFAULT_TOLERANCES`.
+            scene_tolerances (dict): Bounds of individual scenes by scene name.
+                They override the bounds of `tolerances` for the metrics they
+                contain.
+            time_budget (float): Maximum ratio of the render time to the
+                reference render time.
+            scene_time_budgets (dict): Time budget ratios of individual scenes
+                by scene name.
+            reference_directory (str): Directory the references were blessed to
+                (see `bless`).
+            exit_on_failure (bool): Exit the process with status 1 if any scene
+                failed, e.g. to fail a CI job.
+
+        Returns:
+            list of dict: The results of every scene, in registration order.
+        """
+        store = ReferenceStore(f"{reference_directory}/{self.name}")
+        tolerances = DEFAULT_TOLERANCES if tolerances is None else tolerances
+        scene_tolerances = scene_tolerances or {}
+        scene_time_budgets = scene_time_budgets or {}
+
+        results = []
+        for scene in self.scenes:
+            results.append(
+                store.check(
+                    scene.name,
+                    f"{self.render_directory}/{scene.name}_nori.exr",
+                    self.__render_time(scene.name, "nori"),
+                    {**tolerances, **scene_tolerances.get(scene.name, {})},
+                    scene_time_budgets.get(scene.name, time_budget),
+                )
+            )
+
+        regression_directory = f"{self.directory}/regression"
+        os.makedirs(regression_directory, exist_ok=True)
+        with open(f"{regression_directory}/report.json", "w") as f:
+            json.dump(results, f, indent=4)
+
+        failed = [result for result in results if not result["passed"]]
+        for result in results:
+            status = "PASS" if result["passed"] else "FAIL"
+            print(f"{status} {result['scene']}")
+            for failure in result["failures"]:
+                print(f"     {failure}")
+        print(f"{len(results) - len(failed)} of {len(results)} scenes passed")
+
+        if failed and exit_on_failure:
+            sys.exit(1)
+        return results
+
+    def report_timings(self, trace=False):
+        """
+        Print a summary of the time spent in every phase of the suite and
+        write the run record.
+
+        Every phase of every scene (XML generation, conversion, the Nori
+        subprocess, Mitsuba scene loading and rendering, writing images,
+        grid assembly, comparison, ...) is timed while the suite runs. The
+        records are written to `timings/run.json` and `timings/run.csv` in
+        the suite directory.
+
+        Args:
+            trace (bool): Also write `timings/trace.json` in the Chrome trace
+                event format, which shows the phases of all worker threads on a
+                timeline in chrome://tracing or https://ui.perfetto.dev.
+
+        Returns:
+            list of dict: Count, total, mean and maximum duration of every
+                phase.
+        """
+        timing_directory = f"{self.directory}/timings"
+        os.makedirs(timing_directory, exist_ok=True)
+        self.profiler.write_json(f"{timing_directory}/run.json")
+        self.profiler.write_csv(f"{timing_directory}/run.csv")
+        if trace:
+            self.profiler.write_chrome_trace(f"{timing_directory}/trace.json")
+
+        print(self.profiler.format_summary())
+        print(f"Timings written to {timing_directory}")
+        return self.profiler.summary()
@@ -0,0 +1,135 @@
+import xml.etree.ElementTree as ET
+
+XML_DECLARATION = '<?xml version="1.0" ?>'
+
+
+def escape(data):
+    """Escape text and attribute values the same way minidom does."""
+    return (
+        data.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+def node_parts(node):
+    """Return (tag, attributes, children, text) of an ElementTree element or xmltag."""
+    if isinstance(node, ET.Element):
+        return node.tag, node.attrib.items(), list(node), node.text
+    return node.tagname, node.kwargs.items(), node.children, None
+
+
+class _LineWriter:
+    """Write lines to a stream, separated (not terminated) by newlines."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.separator = ""
+
+    def line(self, text):
+        self.stream.write(self.separator)
+        self.stream.write(text)
+        self.separator = "\n"
+
+
+def _attrib_str(attrib):
+    return "".join(f' {key}="{escape(value)}"' for key, value in attrib)
+
+
+def _write_node(writer, node, level, indent):
+    tag, attrib, children, text = node_parts(node)
+    prefix = indent * level
+    attrib_str = _attrib_str(attrib)
+
+    if not children:
+        if text:
+            writer.line(f"{prefix}<{tag}{attrib_str}>{escape(text)}</{tag}>")
+        else:
+            writer.line(f"{prefix}<{tag}{attrib_str}/>")
+        return
+
+    writer.line(f"{prefix}<{tag}{attrib_str}>")
+    # Whitespace between elements (e.g. from parsing an indented file) is dropped
+    if text and text.strip():
+        writer.line(f"{prefix}{indent}{escape(text)}")
+    for child in children:
+        _write_child(writer, child, level + 1, indent)
+    writer.line(f"{prefix}</{tag}>")
+
+
+def _write_child(writer, node, level, indent):
+    _write_node(writer, node, level, indent)
+    tail = node.tail if isinstance(node, ET.Element) else None
+    if tail and tail.strip():
+        writer.line(f"{indent * level}{escape(tail)}")
+
+
+def write_xml(root, file, indent="\t", trailing_newline=True):
+    """
+    Write an indented XML document in a single pass.
+
+    `root` can be an ElementTree element or an `xmltag`, and `file` a path or
+    a text stream. The output is identical to pretty-printing with
+    `minidom.parseString(ET.tostring(root)).toprettyxml(indent)`, except that
+    whitespace-only text is dropped.
+    """
+    if isinstance(file, str):
+        with open(file, "w") as f:
+            write_xml(root, f, indent, trailing_newline)
+        return
+
+    writer = _LineWriter(file)
+    writer.line(XML_DECLARATION)
+    _write_node(writer, root, 0, indent)
+    if trailing_newline:
+        file.write("\n")
+
+
+class XmlStreamWriter:
+    """
+    Write an indented XML document one child of the root at a time.
+
+    The output is identical to `write_xml` of a root with the same tag,
+    attributes and children, but children can be written (and discarded)
+    as soon as they are available.
+    """
+
+    def __init__(self, file, tag, attrib=None, indent="\t", trailing_newline=True):
+        self.owns_file = isinstance(file, str)
+        self.file = open(file, "w") if self.owns_file else file
+        self.tag = tag
+        self.attrib_str = _attrib_str((attrib or {}).items())
+        self.indent = indent
+        self.trailing_newline = trailing_newline
+        self.has_children = False
+
+        self.writer = _LineWriter(self.file)
+        self.writer.line(XML_DECLARATION)
+
+    def write(self, node):
+        """Write `node` (an ElementTree element or `xmltag`) as the next child."""
+        if not self.has_children:
+            self.writer.line(f"<{self.tag}{self.attrib_str}>")
+            self.has_children = True
+        _write_child(self.writer, node, 1, self.indent)
+
+    def close(self):
+        if self.has_children:
+            self.writer.line(f"</{self.tag}>")
+        else:
+            self.writer.line(f"<{self.tag}{self.attrib_str}/>")
+        if self.trailing_newline:
+            self.file.write("\n")
+        if self.owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None and self.owns_file:
+            # Leave the incomplete document unterminated
+            self.file.close()
+            return
+        self.close()